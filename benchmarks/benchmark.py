@@ -0,0 +1,247 @@
+# BENCHMARK
+#
+# times the pathway and its components across grids of strata (S), days (D) and model of
+# care, recording the best wall time over a number of repeats and the peak memory traced
+# while running once, and saves the results to a JSON baseline file; compare then flags the
+# cases of a new run that are slower (or use more memory) than a baseline by a threshold
+#
+# usage:
+#   python benchmarks/benchmark.py run [--quick] [--repeat N] [--match TEXT] [--output FILE]
+#   python benchmarks/benchmark.py compare BASELINE.json CURRENT.json [--threshold 0.1]
+#
+# the cases of outcomes_for_moc(..., backend="jit") are only run when Numba is installed
+# the cases of outcomes_for_ensemble over ensembles of E members are only run up to
+# MAX_ENSEMBLE_ELEMENTS incidences (E * S * D), beyond which they would not fit in memory
+#
+# compare exits with status 1 if there are any regressions, so it can gate a CI job
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import patientpaths
+from patientpaths.components import Bed_Occupancy, allocate, allocate_duration
+from patientpaths.fused import JIT_AVAILABLE
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+from patientpaths.simulator import presentation_matrix
+
+STRATA = (4, 40, 400, 2000)
+DAYS = (36, 365, 1500)
+QUICK_STRATA = (4, 40)
+QUICK_DAYS = (36, 365)
+ENSEMBLE = (1, 16, 128)
+QUICK_ENSEMBLE = (1, 16)
+MAX_ENSEMBLE_ELEMENTS = 2**25
+
+
+def incidence(num_strata, num_days, scale, seed, batch_shape=()):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, scale, [*batch_shape, num_strata, num_days]).astype(
+        np.float64
+    )
+
+
+def risk(num_strata):
+    return 1 + np.arange(num_strata) % 2
+
+
+def bench_outcomes_for_moc(moc_name, num_strata, num_days, backend="numpy"):
+    moc = model_of_care(moc_name, "ACT")
+    di_mild = incidence(num_strata, num_days, 2_000 // num_strata + 10, 0)
+    di_sev = incidence(num_strata, num_days, 500 // num_strata + 5, 1)
+    return lambda: patientpaths.outcomes_for_moc(
+        moc, di_mild, di_sev, risk(num_strata), backend=backend
+    )
+
+
+def bench_outcomes_for_ensemble(num_members, num_strata, num_days):
+    moc = model_of_care("default", "ACT")
+    di_mild = incidence(
+        num_strata, num_days, 2_000 // num_strata + 10, 0, [num_members]
+    )
+    di_sev = incidence(num_strata, num_days, 500 // num_strata + 5, 1, [num_members])
+    return lambda: patientpaths.outcomes_for_ensemble(
+        moc, di_mild, di_sev, risk(num_strata)
+    )
+
+
+def bench_allocate(num_strata, num_days):
+    demand = incidence(num_strata, num_days, 100, 0)
+
+    def run():
+        for d in range(num_days):
+            allocate(num_strata, demand[:, d], 1_000)
+
+    return run
+
+
+def bench_allocate_duration(num_strata, num_days, LoS=10):
+    demand = incidence(num_strata, num_days, 10, 0)
+
+    def run():
+        avail = np.tile(448.0, [num_days])
+        for d in range(num_days):
+            allocate_duration(num_strata, num_days, avail, d, LoS, demand[:, d])
+
+    return run
+
+
+def bench_bed_occupancy(num_strata, num_days, LoS=10):
+    demand = incidence(num_strata, num_days, 10, 0)
+
+    def run():
+        beds = Bed_Occupancy(448.0, LoS, num_days)
+        for d in range(num_days):
+            beds.admit(d, demand[:, d])
+
+    return run
+
+
+def bench_presentation_apply(num_strata, num_days):
+    moc = model_of_care("default", "ACT")
+    di_mild = incidence(num_strata, num_days, 100, 0)
+    di_sev = incidence(num_strata, num_days, 100, 1)
+
+    def run():
+        pres = presentation_matrix(moc, np.zeros([num_strata]))
+        for d in range(num_days):
+            pres["di_mild"] = di_mild[:, d]
+            pres["di_sev"] = di_sev[:, d]
+            pres.apply()
+
+    return run
+
+
+def cases(quick=False):
+    strata = QUICK_STRATA if quick else STRATA
+    days = QUICK_DAYS if quick else DAYS
+    members = QUICK_ENSEMBLE if quick else ENSEMBLE
+    for num_strata in strata:
+        for num_days in days:
+            for moc_name in MOC_NAMES:
+                yield (
+                    f"outcomes_for_moc[moc={moc_name},S={num_strata},D={num_days}]",
+                    bench_outcomes_for_moc(moc_name, num_strata, num_days),
+                )
+            # the fused day loop, to compare with the default moc above
+            if JIT_AVAILABLE:
+                yield (
+                    f"outcomes_for_moc[backend=jit,S={num_strata},D={num_days}]",
+                    bench_outcomes_for_moc("default", num_strata, num_days, "jit"),
+                )
+            # the ensemble batched along a leading axis, per member to compare with E=1
+            for num_members in members:
+                if num_members * num_strata * num_days <= MAX_ENSEMBLE_ELEMENTS:
+                    yield (
+                        f"outcomes_for_ensemble[E={num_members},S={num_strata},D={num_days}]",
+                        bench_outcomes_for_ensemble(num_members, num_strata, num_days),
+                    )
+            yield (
+                f"allocate[S={num_strata},D={num_days}]",
+                bench_allocate(num_strata, num_days),
+            )
+            yield (
+                f"allocate_duration[S={num_strata},D={num_days}]",
+                bench_allocate_duration(num_strata, num_days),
+            )
+            yield (
+                f"Bed_Occupancy.admit[S={num_strata},D={num_days}]",
+                bench_bed_occupancy(num_strata, num_days),
+            )
+            yield (
+                f"Presentation_Matrix.apply[S={num_strata},D={num_days}]",
+                bench_presentation_apply(num_strata, num_days),
+            )
+
+
+def measure(run, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    # memory is traced on a separate call, so that tracing does not slow the timings
+    tracemalloc.start()
+    run()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_bytes": peak_bytes}
+
+
+def run_benchmarks(args):
+    results = {}
+    for name, run in cases(args.quick):
+        if args.match and args.match not in name:
+            continue
+        results[name] = measure(run, args.repeat)
+        print(
+            f"{name:60} {results[name]['seconds']:10.4f}s"
+            f" {results[name]['peak_bytes'] / 2**20:10.1f}MiB",
+            flush=True,
+        )
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "patientpaths": patientpaths.__version__,
+                "numpy": np.__version__,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"saved {len(results)} results to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+    regressions = 0
+    for name in sorted(set(baseline) & set(current)):
+        for metric in ("seconds", "peak_bytes"):
+            ratio = current[name][metric] / max(baseline[name][metric], 1e-12)
+            if ratio > 1 + args.threshold:
+                regressions += 1
+                flag = "REGRESSION"
+            elif ratio < 1 - args.threshold:
+                flag = "improved"
+            else:
+                continue
+            print(f"{flag:10} {name:60} {metric:10} x{ratio:.2f}")
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"{'missing':10} {name} (only in one file)")
+    print(f"{regressions} regressions beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark patientpaths.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    run = commands.add_parser("run", help="run the benchmarks and save the results")
+    run.add_argument("--quick", action="store_true", help="only the smaller grids")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--match", help="only the cases whose name contains this")
+    run.add_argument("--output", default="benchmark.json")
+    run.set_defaults(handler=run_benchmarks)
+    compare_parser = commands.add_parser(
+        "compare", help="flag regressions of a run against a baseline"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.set_defaults(handler=compare)
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,10 +26,15 @@ setuptools.setup(
     package_data={"": ["py.typed"]},
     url="https://github.com/anu-act-health-covid19-support/patientpaths",
     license="GPLv3",
-    # TODO: un-comment this part once we have a CLI function to execute again.
-    # entry_points={"console_scripts": ["patientpaths = patientpaths.run:main"]},
+    entry_points={
+        "console_scripts": [
+            "patientpaths = patientpaths.run:main",
+            "patientpaths-server = patientpaths.server:main",
+        ]
+    },
     description="",  # TODO
     install_requires=["numpy"],
+    extras_require={"jit": ["numba"]},
     python_requires=">=3.6",
     classifiers=[
         "Development Status :: 3 - Alpha",
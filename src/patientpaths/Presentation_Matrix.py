@@ -1,6 +1,13 @@
 # Essentially defines a matrix operation
 # matrix terms are added via the transition function, and values are set by __setitem__ function
 # when apply() is called, all the terms are multiplied and added together to get new values given by __getitem__ function
+# apply(rng) instead draws each term as a binomial of the old value, with the multiplier as its
+# probability, from rng (eg the Replicate_Streams of monte_carlo.py)
+# alternatively apply_days() takes the inputs for every day of a simulation and computes every day's values at once
+# the values are of the dtype of the default (eg float32), in which every term is computed (rather than
+# promoted to a wider type with the multipliers or inputs)
+
+import numpy as np
 
 
 class Presentation_Matrix:
@@ -28,12 +35,92 @@ class Presentation_Matrix:
     def __getitem__(self, label):
         return self.values.get(label, self.default.copy())
 
-    def apply(self):
+    def apply(self, rng=None):
         old_values = {a: b.copy() for a, b in self.values.items()}
         for key in self.values.keys():
             self.values[key] = self.default.copy()
         for from_label in self.multipliers.keys():
             for to_label in self.multipliers[from_label].keys():
-                self.values[to_label] += (
-                    self.multipliers[from_label][to_label] * old_values[from_label]
+                multiplier = self.multipliers[from_label][to_label]
+                if rng is None:
+                    self.values[to_label] += np.multiply(
+                        multiplier, old_values[from_label], dtype=self.default.dtype
+                    )
+                else:
+                    self.values[to_label] += rng.binomial(
+                        old_values[from_label], multiplier
+                    )
+
+    # the transitions as a label index and a dense coefficient matrix, where
+    # matrix[index[to_label], index[from_label]] is the transition multiplier
+    def compile(self, dtype=np.float64):
+        labels = tuple(self.values.keys())
+        index = {label: i for i, label in enumerate(labels)}
+        matrix = np.zeros([len(labels), len(labels)], dtype=dtype)
+        for from_label in self.multipliers.keys():
+            for to_label in self.multipliers[from_label].keys():
+                matrix[index[to_label], index[from_label]] = self.multipliers[
+                    from_label
+                ][to_label]
+        return labels, matrix
+
+    # inputs maps labels to their values for every day (days on the last axis), as
+    # would be set before each daily call to apply(); every label is then given the
+    # values it would hold after apply() on each of those days, and the [labels, ..., D]
+    # tensor of all of them is returned (in the label order of compile())
+    # a label that is not an input is read lagged by a day, as apply() reads the old
+    # values, so the labels can be computed a whole series at a time in dependency order;
+    # the terms are summed in the same order as apply() so the results are identical
+    def apply_days(self, inputs):
+        dtype = np.result_type(self.default)
+        inputs = {label: np.asarray(value, dtype) for label, value in inputs.items()}
+        for label, value in inputs.items():
+            self[label] = value
+        labels, matrix = self.compile(dtype)
+        sources = [labels.index(label) for label in self.multipliers.keys()]
+        num_days = np.shape(next(iter(inputs.values())))[-1]
+        series = np.zeros(
+            (len(labels),) + np.shape(self.default) + (num_days,), dtype=dtype
+        )
+
+        def transfer(to, start, stop):
+            for i in sources:
+                if matrix[to, i] == 0:
+                    continue
+                if labels[i] in inputs:
+                    series[to, ..., start:stop] += (
+                        matrix[to, i] * inputs[labels[i]][..., start:stop]
+                    )
+                else:
+                    lag = max(start, 1)
+                    series[to, ..., lag:stop] += (
+                        matrix[to, i] * series[i, ..., slice(lag - 1, stop - 1)]
+                    )
+
+        order = []
+        while len(order) < len(labels):
+            ready = [
+                to
+                for to in range(len(labels))
+                if to not in order
+                and all(
+                    i in order or matrix[to, i] == 0 or labels[i] in inputs
+                    for i in sources
                 )
+            ]
+            if not ready:
+                break
+            order += ready
+        if len(order) == len(labels):
+            for to in order:
+                transfer(to, 0, num_days)
+        else:
+            # labels that feed back into themselves can only be resolved a day at a time
+            for d in range(num_days):
+                for to in range(len(labels)):
+                    transfer(to, d, d + 1)
+
+        for i, label in enumerate(labels):
+            self[label] = series[i]
+        self.set_default(np.zeros_like(series[0]))
+        return series
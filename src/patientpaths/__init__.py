@@ -1,4 +1,18 @@
 __version__ = "0.0.1"
-__all__ = ["outcomes_for_moc"]
+__all__ = [
+    "Profiler",
+    "SimulationResult",
+    "Simulator",
+    "outcomes_for_ensemble",
+    "outcomes_for_jurisdictions",
+    "outcomes_for_moc",
+]
 
-from .outcomes_for_moc import outcomes_for_moc
+from .outcomes_for_moc import (
+    outcomes_for_ensemble,
+    outcomes_for_jurisdictions,
+    outcomes_for_moc,
+)
+from .profiler import Profiler
+from .simulation_result import SimulationResult
+from .simulator import Simulator
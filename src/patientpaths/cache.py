@@ -0,0 +1,137 @@
+# CACHE
+#
+# an opt-in on-disk cache of the results of outcomes_for_moc, for analyses which re-run the
+# same model of care, jurisdiction and forecast: Result_Cache(directory, max_bytes) has an
+# outcomes_for_moc method taking the same arguments, which returns the cached result if there
+# is one, and otherwise runs the simulation and caches its result
+#
+# results are content-addressed, keyed by a hash of the fields of the model of care, the
+# bytes (and dtype and shape) of di_mild, di_sev and risk, the other arguments (other than the
+# backend, whose results are identical), and the version of patientpaths; each is stored as
+# one .npy file per output field in a directory named by its key, so a cached result is
+# returned with its arrays memory-mapped (read-only) rather than read into memory
+# once the cache is larger than max_bytes the least recently used results are evicted, and
+# hits, misses and evictions count how the cache has been used
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from . import __version__
+from .outcomes_for_moc import outcomes_for_moc
+from .simulation_result import FIELDS, SimulationResult
+
+
+def content_hash(*values):
+    digest = hashlib.sha256()
+
+    def update(value):
+        if isinstance(value, np.ndarray):
+            digest.update(f"array {value.dtype.str} {value.shape}".encode())
+            digest.update(memoryview(np.ascontiguousarray(value)).cast("B"))
+        elif isinstance(value, (list, tuple)):
+            digest.update(f"{type(value).__name__} {len(value)}".encode())
+            for item in value:
+                update(item)
+        elif hasattr(value, "__dict__"):
+            digest.update(f"namespace {len(vars(value))}".encode())
+            for name, item in sorted(vars(value).items()):
+                update(name)
+                update(item)
+        else:
+            digest.update(f"{type(value).__name__} {value!r}".encode())
+
+    for value in values:
+        update(value)
+    return digest.hexdigest()
+
+
+class Result_Cache:
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def outcomes_for_moc(
+        self,
+        moc,
+        di_mild,
+        di_sev,
+        risk,
+        legacy_duration=False,
+        fields=FIELDS,
+        backend="numpy",
+        dtype=np.float64,
+    ):
+        fields = [field for field in FIELDS if field in fields]
+        key = content_hash(
+            __version__,
+            moc,
+            np.asarray(di_mild),
+            np.asarray(di_sev),
+            np.asarray(risk),
+            legacy_duration,
+            fields,
+            np.dtype(dtype).str,
+        )
+        path = os.path.join(self.directory, key)
+        if os.path.isdir(path):
+            self.hits += 1
+            os.utime(path)
+            return SimulationResult(
+                {
+                    field: np.load(os.path.join(path, field + ".npy"), mmap_mode="r")
+                    for field in fields
+                }
+            )
+
+        self.misses += 1
+        result = outcomes_for_moc(
+            moc,
+            di_mild,
+            di_sev,
+            risk,
+            legacy_duration,
+            fields,
+            backend=backend,
+            dtype=dtype,
+        )
+        # written alongside then renamed into place, so a result is never seen half written
+        partial = tempfile.mkdtemp(prefix=".partial-", dir=self.directory)
+        for field, values in result.items():
+            np.save(os.path.join(partial, field + ".npy"), values)
+        try:
+            os.rename(partial, path)
+        except OSError:
+            # cached by another process in the meantime
+            shutil.rmtree(partial)
+        self.evict(keep=path)
+        return result
+
+    # remove the least recently used results until the cache is within max_bytes, other than
+    # the result at keep
+    def evict(self, keep):
+        total = directory_size(keep)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.startswith(".partial-") and path != keep:
+                size = directory_size(path)
+                entries.append((os.path.getmtime(path), size, path))
+                total += size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path)
+            total -= size
+            self.evictions += 1
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
@@ -0,0 +1,146 @@
+# CAPACITY_PLANNING
+#
+# find the least capacity of a resource (eg ICU beds) for which a forecast meets a target, such
+# as no patient ever being turned away from ICU, rather than looping outcomes_for_moc over
+# candidate capacities
+# inputs are:
+#    * moc, di_mild, di_sev, risk: a model of care and forecast, as taken by outcomes_for_moc
+#    * resource: the resource to plan, one of RESOURCES, whose capacity is the moc field cap_<resource>
+#    * target: the target to meet, one of
+#         - Max_Days_Over_Capacity(limit): at most limit days on which the resource turns patients
+#           away, with ZERO_EXCESS = Max_Days_Over_Capacity(0) for no excess at all
+#         - Max_Deaths(limit): at most limit deaths over all strata and days, for ICU only
+#
+# each target lists the resources it may plan, those in whose capacity it is monotone: more ED
+# or clinic capacity admits more severe patients, who may then die in ICU or be turned away from
+# a full ward and die, so deaths may rise with those capacities and only ICU beds are planned
+# for deaths
+#
+# the presentations to each setting do not depend on any capacity, so they are computed once and
+# every candidate capacity is simulated from them; each target is a running total of a measure of
+# each day that is never negative, so a simulation stops on the day its total exceeds the limit
+# the capacity is searched for in whole beds (or consultations), doubling from one until the
+# target is met and then bisecting between the largest capacity found to miss it and that, which
+# assumes any capacity above one meeting the target also meets it; the capacity found meets the
+# target, and one less does not (or is no capacity at all)
+# dtype (eg np.float32) is that of the simulations, as taken by outcomes_for_moc
+# other fields derived from the capacity in model_of_care (eg cap_Clinic of the 'clinics' model
+# of care) are not recomputed
+#
+# returns a Capacity_Plan of the capacity found (None if even maximum misses the target), the
+# number of simulations run and the number of days simulated over all of them
+
+from types import SimpleNamespace
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from .simulator import Simulator, presentation_demands, presentation_matrix
+
+# the resources with a capacity, and the fields of the patients each turns away
+RESOURCES = {
+    "ICU": ("excess_icu",),
+    "Ward": ("excess_ward",),
+    "ED": ("excess_ed_sev", "excess_ed_mld"),
+    "Clinic": ("excess_clinic_sev", "excess_clinic_mld"),
+    "GP": ("excess_gp",),
+}
+
+
+class Max_Days_Over_Capacity(NamedTuple):
+    limit: int
+    resources = tuple(RESOURCES)
+
+    def measure(self, resource, values):
+        return any(np.any(values[field] > 0) for field in RESOURCES[resource])
+
+
+class Max_Deaths(NamedTuple):
+    limit: float
+    resources = ("ICU",)
+
+    def measure(self, resource, values):
+        return values["deaths"].sum()
+
+
+ZERO_EXCESS = Max_Days_Over_Capacity(0)
+
+
+class Capacity_Plan(NamedTuple):
+    capacity: Optional[int]
+    simulations: int
+    days_simulated: int
+
+
+# the running total of a target's measure over the days of a simulation, as taken by
+# SimulationResult.record
+class Target_Total:
+    def __init__(self, target, resource):
+        self.target = target
+        self.resource = resource
+        self.total = 0
+
+    def record(self, d, **values):
+        self.total += self.target.measure(self.resource, values)
+
+    @property
+    def exceeded(self):
+        return self.total > self.target.limit
+
+
+def minimum_capacity(
+    moc,
+    di_mild,
+    di_sev,
+    risk,
+    resource,
+    target=ZERO_EXCESS,
+    legacy_duration=False,
+    maximum=2**24,
+    dtype=np.float64,
+):
+    assert resource in RESOURCES, f"unknown resource {resource}"
+    assert (
+        resource in target.resources
+    ), f"{type(target).__name__} cannot plan the capacity of {resource}"
+    num_strata, num_days = di_mild.shape
+    pres = presentation_matrix(moc, np.zeros([num_strata], dtype))
+    pres.apply_days({"di_mild": di_mild, "di_sev": di_sev})
+    demands = presentation_demands(pres)
+    simulations = days_simulated = 0
+
+    def meets_target(capacity):
+        nonlocal simulations, days_simulated
+        planned = SimpleNamespace(**vars(moc))
+        setattr(planned, "cap_" + resource, capacity)
+        total = Target_Total(target, resource)
+        simulator = Simulator(
+            planned,
+            risk,
+            num_days,
+            legacy_duration=legacy_duration,
+            result=total,
+            dtype=dtype,
+        )
+        simulations += 1
+        for d in range(num_days):
+            simulator.advance(*(demand[..., d] for demand in demands))
+            days_simulated += 1
+            if total.exceeded:
+                return False
+        return True
+
+    # the largest capacity known to miss the target, and the least known to meet it
+    # (the ward has at least one bed, as ED capacity depends on the fraction of it free)
+    missed, met = (0 if resource == "Ward" else -1), 1
+    while not meets_target(met):
+        if met >= maximum:
+            return Capacity_Plan(None, simulations, days_simulated)
+        missed, met = met, min(2 * met, maximum)
+    while met - missed > 1:
+        capacity = (missed + met) // 2
+        if meets_target(capacity):
+            met = capacity
+        else:
+            missed = capacity
+    return Capacity_Plan(met, simulations, days_simulated)
@@ -0,0 +1,88 @@
+# COMPACTION
+#
+# run outcomes_for_moc on only the strata that can present anyone, and expand the results back
+# to every stratum, for fine stratifications where many strata have no incidence at all (eg
+# ages by small areas); compaction.outcomes_for_moc takes the same arguments as outcomes_for_moc
+# and returns the same results
+#
+# the results are exactly (bit for bit) those of outcomes_for_moc, as a stratum with no mild or
+# severe incidence on any day (of any leading axis, eg ensemble member) presents no demand to
+# any service: it adds nothing to the cumulative demand of the strata after it in the priority
+# order of an allocation, nor to the beds occupied, so the other strata's outputs do not depend
+# on it, and all of its own outputs are zero
+# except that with legacy_duration=True the first stratum is always kept: the legacy allocation
+# of beds (allocate_duration) resets the availability over the stay to its maximum as each
+# stratum is admitted, whatever it admits, which raises the beds free to the strata after the
+# first; after one stratum the availability is already level, so the others may be dropped
+#
+# strata with incidence are not merged, even when they are contiguous and of the same risk
+# class: the demand for each service is a fraction of the incidence, truncated to whole
+# patients stratum by stratum on allocation, and the truncation of a sum is not the sum of the
+# truncations (eg 0.5 * 3 + 0.5 * 3 admits 1 + 1 patients as two strata, but 3 as one), so a
+# merged stratum would admit more patients than the strata it replaces
+#
+# not for the stochastic simulations of monte_carlo.py, whose draws depend on the strata
+# drawn for
+
+import numpy as np
+
+from .outcomes_for_moc import outcomes_for_moc as outcomes_for_every_stratum
+from .simulation_result import FIELDS, STRATA_FIELDS, SimulationResult
+
+
+# the indices of the strata with any incidence, and the forecast of only those strata
+def compact_strata(di_mild, di_sev, risk, legacy_duration=False):
+    presenting = np.any(di_mild != 0, axis=-1) | np.any(di_sev != 0, axis=-1)
+    batch_axes = tuple(range(presenting.ndim - 1))
+    presenting = np.any(presenting, axis=batch_axes)
+    if legacy_duration:
+        presenting[:1] = True
+    keep = np.flatnonzero(presenting)
+    return (
+        keep,
+        np.take(di_mild, keep, axis=-2),
+        np.take(di_sev, keep, axis=-2),
+        np.take(risk, keep, axis=-1),
+    )
+
+
+# the result of every stratum, from the result of those in keep
+def expand_strata(result, keep, num_strata):
+    expanded = {}
+    for field, values in result.items():
+        if field in STRATA_FIELDS:
+            expanded[field] = np.zeros(
+                [*values.shape[:-1], num_strata], dtype=values.dtype
+            )
+            expanded[field][..., keep] = values
+        else:
+            expanded[field] = values
+    return SimulationResult(expanded)
+
+
+def outcomes_for_moc(
+    moc,
+    di_mild,
+    di_sev,
+    risk,
+    legacy_duration=False,
+    fields=FIELDS,
+    profiler=None,
+    backend="numpy",
+    dtype=np.float64,
+):
+    keep, di_mild_kept, di_sev_kept, risk_kept = compact_strata(
+        di_mild, di_sev, risk, legacy_duration
+    )
+    result = outcomes_for_every_stratum(
+        moc,
+        di_mild_kept,
+        di_sev_kept,
+        risk_kept,
+        legacy_duration,
+        fields,
+        profiler,
+        backend,
+        dtype,
+    )
+    return expand_strata(result, keep, np.shape(di_mild)[-2])
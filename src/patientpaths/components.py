@@ -1,30 +1,105 @@
 import numpy as np
 
+INT32_MAX = np.iinfo(np.int32).max
+
 
 # for a resource of a given capacity, and a demand vector from each of the cohorts
 # allocate the resources to the demand in order, returning how many are admitted to the resource
 # as a vector and the excess vector, and the new capacity
+# the strata are the last axis of demand, any leading axes (eg ensemble members, days or scenarios)
+# are allocated independently against a capacity of the same (or broadcastable) leading shape
+# patients are whole, so for non-negative demand and capacity the in-order allocation is the
+# truncated demand clipped to what is left after the cohorts before it: cumsum rather than a loop
+# the running totals are of whole patients in int32, as admit and excess are, so a day's demand
+# for a resource over all the strata must be fewer than 2^31 patients
 def allocate(num_strata: int, demand: np.ndarray, capacity: np.ndarray):
-    admit = np.zeros(shape=num_strata, dtype=np.int32)
-    excess = np.zeros(shape=num_strata, dtype=np.int32)
-    for s in range(num_strata):
-        admit[s] = np.minimum(demand[s], capacity)
-        capacity = capacity - admit[s]
-        excess[s] = demand[s] - admit[s]
-    return admit, excess, capacity
+    want = np.asarray(demand).astype(np.int32)
+    before = np.cumsum(want, axis=-1, dtype=np.int32)
+    before -= want
+    room = np.clip(np.floor(capacity), 0, INT32_MAX).astype(np.int32)
+    admit = np.maximum(np.expand_dims(room, -1) - before, 0)
+    np.minimum(want, admit, out=admit)
+    return admit, want - admit, capacity - admit.sum(axis=-1, dtype=np.int32)
 
 
 # for a resource with an availability vector (capacity over days), and a demand
 # vector each which demand the resource for LoS (length of stay) days, starting
 # from day d, adjust the availability vector to admit the demand returning the
 # admit and excess vectors
-def allocate_duration(num_strata: int, num_days: int, avail, d: int, LoS: int, demand):
-    admit = np.zeros(shape=num_strata, dtype=np.int32)
-    excess = np.zeros(shape=num_strata, dtype=np.int32)
+# days are the last axis of avail and strata the last axis of demand, leading axes
+# of both are treated as independent simulations
+# legacy=True keeps the behaviour of the original reimplementation, which holds a bed for
+# only LoS - 1 days, and resets the availability over the stay to its maximum (not its
+# elementwise maximum with zero); legacy=False holds the bed for the LoS days d..d+LoS-1
+def allocate_duration(
+    num_strata: int, num_days: int, avail, d: int, LoS: int, demand, legacy=True
+):
+    admit = np.zeros(shape=np.shape(demand), dtype=np.int32)
+    excess = np.zeros(shape=np.shape(demand), dtype=np.int32)
     for s in range(num_strata):
-        admit[s] = min(avail[d], demand[s])
-        excess[s] = demand[s] - admit[s]
-        x = np.minimum(d + LoS - 1, num_days)
-        avail[d:x] = avail[d:x] - admit[s]
-        avail[d:x] = np.max(avail[d:x], 0)
+        admit[..., s] = np.minimum(avail[..., d], demand[..., s])
+        excess[..., s] = demand[..., s] - admit[..., s]
+        if legacy:
+            x = np.minimum(d + LoS - 1, num_days)
+            avail[..., d:x] = avail[..., d:x] - admit[..., s, None]
+            avail[..., d:x] = np.max(avail[..., d:x], -1, keepdims=True)
+        else:
+            x = np.minimum(d + LoS, num_days)
+            avail[..., d:x] = np.maximum(avail[..., d:x] - admit[..., s, None], 0)
     return admit, excess
+
+
+# the beds of a resource (eg ICU or ward) of a given capacity, where each patient
+# admitted on day d occupies a bed for LoS (length of stay) days, as allocate_duration
+# with legacy=False, but with the scheduled discharges kept in a ring buffer keyed by day
+# so that admitting a day's demand is an allocate() of the beds free on that day, rather
+# than an update of the availability vector over the whole stay of each stratum
+# days must be admitted in order, and free is the availability on the latest day admitted
+# (the state is only the beds occupied and the discharges of the next LoS days, so that a
+# simulation's state does not grow with its number of days)
+# with legacy=True the availability vector of allocate_duration with legacy=True is kept
+# instead, to reproduce the results of the original reimplementation
+class Bed_Occupancy:
+    def __init__(self, capacity, LoS, num_days, batch_shape=(), legacy=False):
+        self.capacity = capacity
+        self.LoS = LoS
+        self.num_days = num_days
+        self.legacy = legacy
+        self.today = -1
+        if legacy:
+            assert np.ndim(LoS) == 0, "the legacy stay is the same for every simulation"
+            self.avail_days = np.zeros(
+                [*batch_shape, num_days], dtype=np.result_type(capacity)
+            )
+            self.avail_days[...] = np.expand_dims(capacity, -1)
+        else:
+            self.occupied = np.zeros(batch_shape, dtype=np.int64)
+            self.discharges = np.zeros([np.max(LoS), *batch_shape], dtype=np.int64)
+            # index of each simulation into the discharges of a day, as capacity and LoS
+            # may differ between the simulations of the leading axes
+            self.simulations = tuple(np.indices(batch_shape))
+
+    def admit(self, d, demand):
+        num_strata = np.shape(demand)[-1]
+        if self.legacy:
+            self.today = d
+            return allocate_duration(
+                num_strata, self.num_days, self.avail_days, d, self.LoS, demand
+            )
+        # discharge the patients whose stay has ended
+        for day in range(self.today + 1, d + 1):
+            slot = (day % self.LoS,) + self.simulations
+            self.occupied -= self.discharges[slot]
+            self.discharges[slot] = 0
+        self.today = d
+        admit, excess, _ = allocate(num_strata, demand, self.free)
+        admitted = admit.sum(axis=-1)
+        self.occupied += admitted
+        self.discharges[(d % self.LoS,) + self.simulations] += admitted
+        return admit, excess
+
+    @property
+    def free(self):
+        if self.legacy:
+            return self.avail_days[..., self.today]
+        return self.capacity - self.occupied
@@ -0,0 +1,261 @@
+# FUSED
+#
+# steps 2-6 of the pathway (see Simulator.advance) for every day of a simulation as a single loop
+# over simulations, days and strata, for outcomes_for_moc(..., backend="jit"), so that each day
+# costs a few scalar operations per stratum rather than the dispatch of dozens of small numpy calls
+# day_loop is plain python, which is compiled with Numba when it is installed (pip install numba)
+# as compiled_day_loop; without it, JIT_AVAILABLE is False and backend="jit" runs the numpy path
+#
+# the loop repeats the numpy path operation by operation, in the same order and precision, so
+# the results are identical bit for bit: allocate() as a running total over the strata, the beds
+# of Bed_Occupancy as the count occupied and a ring buffer of discharges (or, with legacy=True,
+# the availability vector of allocate_duration), and the deaths and ICU fractions as products
+# of the same operands; as in Simulator.advance, the ED capacity of step 2 is not used, as step 3
+# allocates the ED's full capacity, so it is not computed
+# the capacities must be finite (as those of JURISTICTIONS with known capacities are)
+#
+# every output field is computed by the loop, and those not in fields are dropped afterwards
+
+import math
+import types
+
+import numpy as np
+
+from .simulation_result import FIELDS, SimulationResult
+from .simulator import icu_fractions
+
+BACKENDS = ("numpy", "jit")
+
+
+# allocate(), of the demand of each stratum in order, into admit and excess
+def allocate_strata(demand, capacity, admit, excess):
+    left = math.floor(capacity)
+    before = 0
+    admitted = 0
+    for s in range(len(demand)):
+        want = int(demand[s])
+        admit[s] = min(want, max(left - before, 0.0))
+        excess[s] = want - admit[s]
+        before += want
+        admitted += admit[s]
+    return capacity - admitted
+
+
+# Bed_Occupancy.admit() of day d, returning the beds occupied after the admissions
+def admit_beds(d, capacity, LoS, occupied, discharges, demand, admit, excess):
+    # discharge the patients whose stay has ended
+    occupied -= discharges[d % LoS]
+    discharges[d % LoS] = 0
+    allocate_strata(demand, capacity - occupied, admit, excess)
+    admitted = 0
+    for s in range(len(admit)):
+        admitted += admit[s]
+    discharges[d % LoS] += admitted
+    return occupied + admitted
+
+
+# allocate_duration() with legacy=True of day d, into the availability of each day
+def admit_beds_legacy(d, LoS, avail, demand, admit, excess):
+    stop = min(d + LoS - 1, len(avail))
+    for s in range(len(demand)):
+        admit[s] = min(avail[d], demand[s])
+        excess[s] = demand[s] - admit[s]
+        most = avail[d] - admit[s]
+        for day in range(d, stop):
+            avail[day] -= admit[s]
+            most = max(most, avail[day])
+        for day in range(d, stop):
+            avail[day] = most
+
+
+# steps 2-6 of every day of every simulation (the first axis of each argument), from the
+# [simulations, S, D] demands of presentation_demands, into the output fields
+def day_loop(
+    legacy,
+    cap_ED,
+    cap_Clinic,
+    cap_GP,
+    cap_ICU,
+    cap_Ward,
+    LoS_ICU,
+    LoS_Ward,
+    frac_ward_to_ICU,
+    frac_ICU_to_death,
+    frac_noICU_to_death,
+    demand_clinic_sev,
+    demand_ed_sev,
+    demand_clinic_mld,
+    demand_ed_mld,
+    demand_gp,
+    deaths,
+    excess_icu,
+    excess_ward,
+    excess_ed_sev,
+    excess_ed_mld,
+    excess_clinic_mld,
+    excess_clinic_sev,
+    excess_gp,
+    admit_icu,
+    admit_ward,
+    admit_ed_sev,
+    admit_ed_mld,
+    admit_clinic_sev,
+    admit_clinic_mld,
+    admit_gp,
+    avail_ed,
+    avail_clinic,
+    avail_gp,
+    avail_icu,
+    avail_ward,
+):
+    num_simulations, num_strata, num_days = demand_gp.shape
+    req_icu = np.zeros(num_strata)
+    try_ward = np.zeros(num_strata)
+    for b in range(num_simulations):
+        occupied_icu = 0
+        occupied_ward = 0
+        discharges_icu = np.zeros(LoS_ICU[b], dtype=np.int64)
+        discharges_ward = np.zeros(LoS_Ward[b], dtype=np.int64)
+        avail_icu_days = np.full(num_days, cap_ICU[b])
+        avail_ward_days = np.full(num_days, cap_Ward[b])
+        for d in range(num_days):
+            # Hospital admissions -- how many can we admit? (step3)
+            clinic = allocate_strata(
+                demand_clinic_sev[b, :, d],
+                cap_Clinic[b],
+                admit_clinic_sev[b, d],
+                excess_clinic_sev[b, d],
+            )
+            ed = allocate_strata(
+                demand_ed_sev[b, :, d],
+                cap_ED[b],
+                admit_ed_sev[b, d],
+                excess_ed_sev[b, d],
+            )
+            # Hospital admissions -- how many can we put in ICU beds? (step4)
+            for s in range(num_strata):
+                admitted = admit_clinic_sev[b, d, s] + admit_ed_sev[b, d, s]
+                req_icu[s] = admitted * frac_ward_to_ICU[b, s]
+                try_ward[s] = admitted - req_icu[s]
+            if legacy:
+                admit_beds_legacy(
+                    d,
+                    LoS_ICU[b],
+                    avail_icu_days,
+                    req_icu,
+                    admit_icu[b, d],
+                    excess_icu[b, d],
+                )
+            else:
+                occupied_icu = admit_beds(
+                    d,
+                    cap_ICU[b],
+                    LoS_ICU[b],
+                    occupied_icu,
+                    discharges_icu,
+                    req_icu,
+                    admit_icu[b, d],
+                    excess_icu[b, d],
+                )
+            for s in range(num_strata):
+                try_ward[s] = try_ward[s] + excess_icu[b, d, s]
+                deaths[b, d, s] = (
+                    admit_icu[b, d, s] * frac_ICU_to_death[b, s]
+                    + excess_icu[b, d, s] * frac_noICU_to_death[b, s]
+                )
+            # Hospital admissions -- how many can we put in ward beds? (step5)
+            if legacy:
+                admit_beds_legacy(
+                    d,
+                    LoS_Ward[b],
+                    avail_ward_days,
+                    try_ward,
+                    admit_ward[b, d],
+                    excess_ward[b, d],
+                )
+            else:
+                occupied_ward = admit_beds(
+                    d,
+                    cap_Ward[b],
+                    LoS_Ward[b],
+                    occupied_ward,
+                    discharges_ward,
+                    try_ward,
+                    admit_ward[b, d],
+                    excess_ward[b, d],
+                )
+            # Out-patient presentations and treatment. (step6)
+            avail_clinic[b, d] = allocate_strata(
+                demand_clinic_mld[b, :, d],
+                clinic,
+                admit_clinic_mld[b, d],
+                excess_clinic_mld[b, d],
+            )
+            avail_ed[b, d] = allocate_strata(
+                demand_ed_mld[b, :, d], ed, admit_ed_mld[b, d], excess_ed_mld[b, d]
+            )
+            avail_gp[b, d] = allocate_strata(
+                demand_gp[b, :, d], cap_GP[b], admit_gp[b, d], excess_gp[b, d]
+            )
+            if legacy:
+                avail_icu[b, d] = avail_icu_days[d]
+                avail_ward[b, d] = avail_ward_days[d]
+            else:
+                avail_icu[b, d] = cap_ICU[b] - occupied_icu
+                avail_ward[b, d] = cap_Ward[b] - occupied_ward
+
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover
+    compiled_day_loop = None
+else:  # pragma: no cover
+    # the compiled loop calls compiled helpers, while day_loop remains plain python
+    compiled_globals = dict(globals())
+    for helper in (allocate_strata, admit_beds, admit_beds_legacy):
+        compiled_globals[helper.__name__] = njit(
+            types.FunctionType(helper.__code__, compiled_globals)
+        )
+    compiled_day_loop = njit(types.FunctionType(day_loop.__code__, compiled_globals))
+JIT_AVAILABLE = compiled_day_loop is not None
+
+
+# the outputs of steps 2-6 of a simulation as outcomes_for_moc, from the demands of
+# presentation_demands, computed by day_loop (or compiled_day_loop)
+def fused_outcomes(
+    moc, risk, demands, legacy_duration=False, fields=FIELDS, day_loop=day_loop
+):
+    *batch_shape, num_strata, num_days = np.shape(demands[0])
+    num_simulations = int(np.prod(batch_shape))
+
+    def per_simulation(value, dtype=np.float64, trailing=()):
+        values = np.broadcast_to(value, [*batch_shape, *trailing]).astype(dtype)
+        return values.reshape([num_simulations, *trailing])
+
+    result = SimulationResult.zeros([num_simulations], num_strata, num_days)
+    day_loop(
+        legacy_duration,
+        *(
+            per_simulation(getattr(moc, "cap_" + resource))
+            for resource in ("ED", "Clinic", "GP", "ICU", "Ward")
+        ),
+        per_simulation(moc.LoS_ICU, np.int64),
+        per_simulation(moc.LoS_Ward, np.int64),
+        *(
+            per_simulation(fraction, trailing=[num_strata])
+            for fraction in icu_fractions(moc, risk)
+        ),
+        *(
+            np.reshape(demand, [num_simulations, num_strata, num_days]).astype(
+                np.float64
+            )
+            for demand in demands
+        ),
+        *(result[field] for field in FIELDS),
+    )
+    return SimulationResult(
+        {
+            field: np.reshape(result[field], [*batch_shape, *result[field].shape[1:]])
+            for field in fields
+        }
+    )
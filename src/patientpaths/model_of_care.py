@@ -7,10 +7,18 @@
 # By default, this returns national capacities. To use jurisdiction capacities
 # specify one of 'ACT', 'NSW', 'NT', 'QLD', 'SA', 'TAS', 'VIC', 'WA'.
 #
+# MODEL_OF_CARE_FOR_JURISDICTIONS(moc_name, jurisdictions) returns the model of care for
+# several jurisdictions at once, to simulate them together, where each parameter that
+# differs between them (eg the capacities) is an array over the jurisdictions.
+# STACKED_MODELS_OF_CARE(mocs) does the same for any list of models of care (eg with
+# capacities changed) of the same moc_name.
+#
 from math import nan
 from types import SimpleNamespace
 from typing import NamedTuple
 
+import numpy as np
+
 
 class Jurisdiction(NamedTuple):
     name: str
@@ -127,3 +135,20 @@ def model_of_care(moc_name, jurisdiction=NATIONAL):
         moc.sev_late_to_Clinic = moc.sev_late_to_ED
 
     return moc
+
+
+def model_of_care_for_jurisdictions(moc_name, jurisdictions):
+    return stacked_models_of_care(
+        [model_of_care(moc_name, jurisdiction) for jurisdiction in jurisdictions]
+    )
+
+
+def stacked_models_of_care(mocs):
+    moc = SimpleNamespace()
+    for name in vars(mocs[0]):
+        values = [getattr(m, name) for m in mocs]
+        if any(value != values[0] for value in values):
+            setattr(moc, name, np.array(values))
+        else:
+            setattr(moc, name, values[0])
+    return moc
@@ -0,0 +1,216 @@
+# MONTE_CARLO
+#
+# uncertainty bands for a model of care, from R replicates of a stochastic simulation in which
+# every routing of the presentations, split of the admitted severe cases into ICU and ward, and
+# death is a binomial draw of whole patients (see Simulator), simulated a block of replicates at
+# a time, each block advanced together as a leading [B] axis, day by day
+# inputs are:
+#    * moc, di_mild, di_sev, risk: a model of care and forecast, as taken by outcomes_for_moc
+#    * replicates: the number of replicates R, or a range of replicate numbers (see below)
+#    * seed: an int or numpy SeedSequence from which the replicates draw
+#    * quantiles: the quantiles of the replicates to return, each in [0, 1]
+#    * dtype: the floating point type of the simulations, as taken by outcomes_for_moc
+#
+# the replicates are drawn in blocks of block_size, each from its own stream, the child of seed
+# spawned for that block, so a block's draws depend only on the seed and its number; the
+# replicates of a large run may be split between worker processes at block boundaries, eg
+# range(0, 1024) and range(1024, 2000), and each simulates exactly those replicates of one
+# run of range(0, 2000) (a seed of None draws fresh entropy, so split runs need a seed)
+#
+# the replicates are summarised as they are simulated by Count_Histograms: for each field, day
+# and stratum, the number of replicates taking each value, which is a whole number of patients
+# above the least value seen; histograms of disjoint ranges of replicates merge into those of
+# their union, so the histograms of workers may be merged and the quantiles taken once, and
+# only the current block and the histograms are held, whatever the number of replicates
+#
+# the outputs are a SimulationResult with a leading quantile axis: [Q, D, S] for the strata, or
+# [Q, D] for a resource; the quantiles are of the replicates' values themselves (the inverted
+# cdf), so the counts remain whole patients
+
+import numpy as np
+
+from .simulation_result import FIELDS, SimulationResult
+from .simulator import Simulator
+
+BLOCK_SIZE = 64
+
+
+class Replicate_Streams:
+    def __init__(self, seed, replicates, block_size=BLOCK_SIZE):
+        if isinstance(replicates, int):
+            replicates = range(replicates)
+        assert replicates.step == 1 and replicates.start % block_size == 0
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.num_replicates = len(replicates)
+        # the bounds within the replicates run here, and the stream, of each block
+        self.blocks = []
+        self.generators = []
+        for start in range(0, self.num_replicates, block_size):
+            child = np.random.SeedSequence(
+                seed.entropy,
+                spawn_key=(*seed.spawn_key, (replicates.start + start) // block_size),
+                pool_size=seed.pool_size,
+            )
+            self.blocks.append((start, min(start + block_size, self.num_replicates)))
+            self.generators.append(np.random.Generator(np.random.PCG64(child)))
+
+    # the positions of the streams, as saved by Simulator.snapshot
+    @property
+    def state(self):
+        return [generator.bit_generator.state for generator in self.generators]
+
+    @state.setter
+    def state(self, state):
+        for generator, position in zip(self.generators, state):
+            generator.bit_generator.state = position
+
+    # binomial draws of n (with the replicates on its first axis) of probability p
+    def binomial(self, n, p):
+        n = np.asarray(n).astype(np.int64)
+        p = np.broadcast_to(p, n.shape)
+        draws = np.empty(n.shape, dtype=np.int64)
+        for (start, stop), generator in zip(self.blocks, self.generators):
+            draws[start:stop] = generator.binomial(n[start:stop], p[start:stop])
+        return draws
+
+
+# the histogram of values (with the replicates on the first axis) as the least value of each
+# cell and the counts [..., W] of the replicates at each whole number above it
+def count_values(values):
+    least = np.min(values, axis=0)
+    above = np.rint(values - least).astype(np.int64)
+    width = int(above.max()) + 1
+    cells = np.arange(least.size).reshape(least.shape) * width
+    counts = np.bincount((cells + above).ravel(), minlength=least.size * width)
+    return least, counts.reshape(least.shape + (width,))
+
+
+# the histogram of the replicates of two histograms
+def merge_counts(first, second):
+    least = np.minimum(first[0], second[0])
+    shifts = [np.rint(part[0] - least).astype(np.int64) for part in (first, second)]
+    width = max(
+        int(shift.max()) + part[1].shape[-1]
+        for shift, part in zip(shifts, (first, second))
+    )
+    counts = np.zeros(least.shape + (width,), dtype=np.int64)
+    for shift, (_, part) in zip(shifts, (first, second)):
+        shifted = np.zeros_like(counts)
+        above = np.expand_dims(shift, -1) + np.arange(part.shape[-1])
+        np.put_along_axis(shifted, above, part, axis=-1)
+        counts += shifted
+    return least, counts
+
+
+class Count_Histograms:
+    def __init__(self, num_strata, num_days, fields=FIELDS, dtype=np.float64):
+        self.num_strata = num_strata
+        self.num_days = num_days
+        self.dtype = dtype
+        # the histogram of each day of each field, once it is recorded
+        self.days = {field: [None] * num_days for field in FIELDS if field in fields}
+
+    # count the outputs of day d of a block of replicates, as taken by SimulationResult.record
+    def record(self, d, **values):
+        for field, days in self.days.items():
+            counts = count_values(values[field])
+            days[d] = counts if days[d] is None else merge_counts(days[d], counts)
+
+    # the histograms of the replicates of both, from disjoint ranges of replicates
+    def merge(self, other):
+        assert (self.num_strata, self.num_days) == (other.num_strata, other.num_days)
+        assert list(self.days) == list(other.days)
+        merged = Count_Histograms(
+            self.num_strata, self.num_days, list(self.days), self.dtype
+        )
+        for field, days in merged.days.items():
+            days[:] = map(merge_counts, self.days[field], other.days[field])
+        return merged
+
+    def quantiles(self, quantiles):
+        quantiles = np.asarray(quantiles)
+        assert quantiles.ndim == 1
+        assert np.all((quantiles >= 0) & (quantiles <= 1))
+        result = SimulationResult.zeros(
+            [len(quantiles)],
+            self.num_strata,
+            self.num_days,
+            list(self.days),
+            self.dtype,
+        )
+        for field, days in self.days.items():
+            for d, (least, counts) in enumerate(days):
+                cdf = np.cumsum(counts, axis=-1)
+                total = cdf[..., -1:]
+                # the smallest value with at least a fraction q of the replicates at or below it
+                rank = np.clip(np.ceil(quantiles * total), 1, total)
+                above = np.sum(cdf[..., None, :] < rank[..., None], axis=-1)
+                result.days[field][d] = np.moveaxis(least[..., None] + above, -1, 0)
+        return result
+
+
+# the histograms of the replicates' outputs, simulating a block at a time
+def replicate_histograms(
+    moc,
+    di_mild,
+    di_sev,
+    risk,
+    replicates,
+    seed=None,
+    legacy_duration=False,
+    fields=FIELDS,
+    block_size=BLOCK_SIZE,
+    dtype=np.float64,
+):
+    if isinstance(replicates, int):
+        replicates = range(replicates)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    num_strata, num_days = di_mild.shape
+    histograms = Count_Histograms(num_strata, num_days, fields, dtype)
+    for start in range(replicates.start, replicates.stop, block_size):
+        streams = Replicate_Streams(
+            seed, range(start, min(start + block_size, replicates.stop)), block_size
+        )
+        simulator = Simulator(
+            moc,
+            risk,
+            num_days,
+            [streams.num_replicates],
+            legacy_duration,
+            fields,
+            result=histograms,
+            rng=streams,
+            dtype=dtype,
+        )
+        simulator.run(di_mild, di_sev)
+    return histograms
+
+
+def outcomes_monte_carlo(
+    moc,
+    di_mild,
+    di_sev,
+    risk,
+    replicates,
+    seed=None,
+    quantiles=(0.05, 0.5, 0.95),
+    legacy_duration=False,
+    fields=FIELDS,
+    block_size=BLOCK_SIZE,
+    dtype=np.float64,
+):
+    histograms = replicate_histograms(
+        moc,
+        di_mild,
+        di_sev,
+        risk,
+        replicates,
+        seed,
+        legacy_duration,
+        fields,
+        block_size,
+        dtype,
+    )
+    return histograms.quantiles(quantiles)
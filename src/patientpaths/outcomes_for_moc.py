@@ -9,6 +9,33 @@
 #    * di_sev: a nunpy array of dimension [S, D], identifying severe cases presenting to the clinical pathway per day (must be of same dimension as di_mild)
 #    * risk: a one dimensional numpy array [S], which is a number for each cohort, which if greater than one identifies the cohort as being 'at risk' with slightly different dynamics.
 #
+# ICU and ward beds are held for LoS_ICU and LoS_Ward days from the day of admission; legacy_duration=True
+# instead reproduces the original reimplementation's results, see allocate_duration in components.py
+#
+# di_mild and di_sev may also carry leading axes (eg [E, S, D] for an ensemble of E forecasts), in which case
+# every member is advanced together day by day and each per-day output gains the same leading axes.
+# outcomes_for_ensemble wraps this for an [E, S, D] stack, returning arrays of shape [E, D, S] (or [E, D] for
+# the capacity outputs), and outcomes_for_jurisdictions for the [J, S, D] forecasts of J jurisdictions, each
+# with its own capacities, simulated together.
+#
+# a Profiler (see profiler.py) passed as profiler records the time spent in each step of the pathway
+#
+# outcomes_for_demands runs steps 2-6 alone, from the demands for each service of presentation_demands (which do
+# not depend on any capacity), for callers that keep the presentations of a forecast to simulate it again
+#
+# backend="jit" runs steps 2-6 of every day as one loop compiled with Numba, if it is installed (see fused.py),
+# with results identical to the default backend="numpy"; without Numba it runs the numpy steps
+#
+# dtype=np.float32 computes the presentations, demands, deaths and availability in single precision, halving
+# the memory of those arrays (and of the deaths and avail_* outputs) from the default np.float64; it runs the
+# numpy steps whatever the backend. The admissions and excesses are whole patients (int32) either way: each
+# demand is truncated to whole patients on allocation, so where a demand lies within float32 rounding (about
+# one part in 10^7) of a whole number, a stratum may admit (or turn away) one patient fewer or more than in
+# double precision, and the difference carries on to the strata and days after it. Availability is exact in
+# float32 only up to 2^24 beds (or consultations).
+#
+# Outputs are a SimulationResult, a mapping of field name to an array over the days of the simulation, of dimension
+# [D, S] for the strata or [D] for a resource; fields may select a subset of the outputs so the rest are never stored
 # Outputs include a range of arrays identifying different factors per day of the simulation, including:
 #  * deaths: number of deaths from each of the cohorts across days of the simulation
 #  * excess_{icu,ward,ed_sev,ed_mld,clinic_mld,clinic_sev,gp}: the vectors of numbers not admitted to each of the services on a given day
@@ -21,156 +48,113 @@
 
 import numpy as np
 
-from .components import allocate, allocate_duration
-from .Presentation_Matrix import Presentation_Matrix
+from .fused import BACKENDS, JIT_AVAILABLE, compiled_day_loop, fused_outcomes
+from .model_of_care import model_of_care_for_jurisdictions
+from .simulation_result import FIELDS
+from .simulator import Simulator, presentation_demands, presentation_matrix
 
 
-def outcomes_for_moc(moc, di_mild, di_sev, risk):
+def outcomes_for_moc(
+    moc,
+    di_mild,
+    di_sev,
+    risk,
+    legacy_duration=False,
+    fields=FIELDS,
+    profiler=None,
+    backend="numpy",
+    dtype=np.float64,
+):
+    assert backend in BACKENDS, f"unknown backend {backend}"
     # Define dimensions that affect variable sizes.
-    num_strata = di_mild.shape[0]
-    num_days = di_mild.shape[1]
-
-    # Identify cohorts with increased risk of ICU admission and death.
-    frac_ward_to_ICU = moc.ward_to_ICU * np.ones([num_strata])
-    frac_ward_to_ICU[risk > 1] = moc.ward_to_ICU_highrisk
-    frac_ICU_to_death = moc.ICU_to_death * np.ones([num_strata])
-    frac_ICU_to_death[risk > 1] = moc.ICU_to_death_highrisk
-    # Halve the survival rate for cases that require ICU admission but cannot
-    # be admitted into an ICU.
-    frac_noICU_to_death = 1 - 0.5 * (1 - frac_ICU_to_death)
-    # misc stuff
-    frac_ward_avail = 1
-    avail_icu = np.tile(moc.cap_ICU, [num_days])
-    avail_ward = np.tile(moc.cap_Ward, [num_days])
+    *batch_shape, num_strata, num_days = di_mild.shape
 
-    # construct the matrix calculating what presentations appear before the healthsystem
-    pres = Presentation_Matrix()
-    pres.set_default(np.zeros([num_strata]))
-    pres.transition("di_mild", "mld_new_GP", moc.mild_to_GP)
-    pres.transition("di_mild", "mld_new_ED", moc.mild_to_ED)
-    pres.transition("di_mild", "mld_new_Clinic", moc.mild_to_Clinic)
-    pres.transition("mld_new_GP", "mld_rpt_ED", moc.mild_GP_rpt_ED)
-    pres.transition("mld_new_GP", "mld_rpt_Clinic", moc.mild_GP_rpt_Clinic)
-    pres.transition("mld_new_ED", "mld_rpt_GP", moc.mild_ED_rpt_GP)
-    pres.transition("mld_rpt_ED", "mld_rpt_GP", moc.mild_ED_rpt_GP)
-    pres.transition("mld_new_Clinic", "mld_rpt_GP", moc.mild_Clinic_rpt_GP)
-    pres.transition("mld_rpt_Clinic", "mld_rpt_GP", moc.mild_Clinic_rpt_GP)
-    pres.transition("di_sev", "sev_new_early", moc.sev_frac_early)
-    pres.transition(
-        "di_sev", "sev_new_early_GP", moc.sev_frac_early * moc.sev_early_to_GP
+    if profiler is not None:
+        profiler.start()
+    # Daily presentations in each setting, for every day up front as they do not
+    # depend on the state of the health system. (steps1 and steps1a)
+    pres = presentation_matrix(moc, np.zeros([*batch_shape, num_strata], dtype))
+    pres.apply_days({"di_mild": di_mild, "di_sev": di_sev})
+    demands = presentation_demands(pres)
+    if profiler is not None:
+        profiler.lap("step1")
+    return outcomes_for_demands(
+        moc, risk, demands, legacy_duration, fields, profiler, backend, dtype
     )
-    pres.transition(
-        "di_sev", "sev_new_early_ED", moc.sev_frac_early * moc.sev_early_to_ED
-    )
-    pres.transition(
-        "di_sev", "sev_new_early_Clinic", moc.sev_frac_early * moc.sev_early_to_Clinic
-    )
-    pres.transition("di_sev", "sev_new_late", moc.sev_frac_late)
-    pres.transition("di_sev", "sev_new_late_ED", moc.sev_frac_late * moc.sev_late_to_ED)
-    pres.transition(
-        "di_sev", "sev_new_late_Clinic", moc.sev_frac_late * moc.sev_late_to_Clinic
-    )
-    pres.transition("sev_new_early", "sev_rpt_late_ED", moc.sev_late_to_ED)
 
-    # create the output_data container with appropriate fields
-    output_data = {
-        s: []
-        for s in [
-            "deaths",
-            "excess_icu",
-            "excess_ward",
-            "excess_ed_sev",
-            "excess_ed_mld",
-            "excess_clinic_mld",
-            "excess_clinic_sev",
-            "excess_gp",
-            "admit_icu",
-            "admit_ward",
-            "admit_ed_sev",
-            "admit_ed_mld",
-            "admit_clinic_sev",
-            "admit_clinic_mld",
-            "admit_gp",
-            "avail_ed",
-            "avail_clinic",
-            "avail_gp",
-        ]
-    }
 
-    for d in range(num_days):
-        # Daily presentations in each setting. (steps1 and steps1a)
-        pres["di_mild"] = di_mild[:, d]
-        pres["di_sev"] = di_sev[:, d]
-        pres.apply()
+# steps 2-6 of outcomes_for_moc, from the [..., S, D] demands for each service
+def outcomes_for_demands(
+    moc,
+    risk,
+    demands,
+    legacy_duration=False,
+    fields=FIELDS,
+    profiler=None,
+    backend="numpy",
+    dtype=np.float64,
+):
+    assert backend in BACKENDS, f"unknown backend {backend}"
+    *batch_shape, _, num_days = np.shape(demands[0])
 
-        # ED consultation capacity, given ward utilisation. (step2)
-        avail_ed = moc.cap_ED * np.minimum(
-            moc.lm_ED_cap_E1
-            + (1 - moc.lm_ED_cap_E1) * frac_ward_avail / moc.lm_ED_cap_W0,
-            1,
-        )
-        # Hospital admissions -- how many can we admit? (step3)
-        admit_clinic_sev, excess_clinic_sev, avail_clinic = allocate(
-            num_strata,
-            pres["sev_rpt_late_Clinic"] + pres["sev_new_late_Clinic"],
-            moc.cap_Clinic,
-        )
-        admit_ed_sev, excess_ed_sev, avail_ed = allocate(
-            num_strata, pres["sev_rpt_late_ED"] + pres["sev_new_late_ED"], moc.cap_ED
-        )
-        # Hospital admissions -- how many can we put in ICU beds? (step4)
-        req_icu = (admit_clinic_sev + admit_ed_sev) * frac_ward_to_ICU
-        try_ward = (admit_clinic_sev + admit_ed_sev) - req_icu
-        admit_icu, excess_icu = allocate_duration(
-            num_strata, num_days, avail_icu, d, moc.LoS_ICU, req_icu
-        )
-        try_ward = try_ward + excess_icu
-        deaths = admit_icu * frac_ICU_to_death + excess_icu * frac_noICU_to_death
-        # Hospital admissions -- how many can we put in ward beds? (step5)
-        admit_ward, excess_ward = allocate_duration(
-            num_strata, num_days, avail_ward, d, moc.LoS_Ward, try_ward
-        )
-        frac_ward_avail = avail_ward[d] / moc.cap_Ward
-        # Out-patient presentations and treatment. (step6)
-        admit_clinic_mld, excess_clinic_mld, avail_clinic = allocate(
-            num_strata, pres["mld_new_Clinic"] + pres["mld_rpt_Clinic"], avail_clinic
-        )
-        admit_ed_mld, excess_ed_mld, avail_ed = allocate(
-            num_strata, pres["mld_new_ED"] + pres["mld_rpt_ED"], avail_ed
-        )
-        admit_gp, excess_gp, avail_gp = allocate(
-            num_strata,
-            pres["mld_new_GP"]
-            + pres["mld_rpt_GP"]
-            + pres["excess_clinic_mld"]
-            + pres["excess_clinic_sev"]
-            + pres["excess_ed_mld"]
-            + pres["excess_ed_sev"],
-            moc.cap_GP,
+    if backend == "jit" and JIT_AVAILABLE and dtype == np.float64:  # pragma: no cover
+        if profiler is not None:
+            profiler.start()
+        result = fused_outcomes(
+            moc, risk, demands, legacy_duration, fields, compiled_day_loop
         )
+        if profiler is not None:
+            profiler.lap("steps2-6")
+        return result
+
+    # the health system's capacity for those presentations, day by day (steps2-6)
+    simulator = Simulator(
+        moc, risk, num_days, batch_shape, legacy_duration, fields, profiler, dtype=dtype
+    )
+    for d in range(num_days):
+        simulator.advance(*(demand[..., d] for demand in demands))
+
+    return simulator.result
 
-        # populate the output container fields for this day
-        output_data["deaths"].append(deaths)
-        output_data["excess_icu"].append(excess_icu)
-        output_data["excess_ward"].append(excess_ward)
-        output_data["excess_ed_sev"].append(excess_ed_sev)
-        output_data["excess_ed_mld"].append(excess_ed_mld)
-        output_data["excess_clinic_mld"].append(excess_clinic_mld)
-        output_data["excess_clinic_sev"].append(excess_clinic_sev)
-        output_data["excess_gp"].append(excess_gp)
-        output_data["admit_icu"].append(admit_icu)
-        output_data["admit_ward"].append(admit_ward)
-        output_data["admit_ed_sev"].append(admit_ed_sev)
-        output_data["admit_ed_mld"].append(admit_ed_mld)
-        output_data["admit_clinic_sev"].append(admit_clinic_sev)
-        output_data["admit_clinic_mld"].append(admit_clinic_mld)
-        output_data["admit_gp"].append(admit_gp)
-        output_data["avail_ed"].append(avail_ed)
-        output_data["avail_clinic"].append(avail_clinic)
-        output_data["avail_gp"].append(avail_gp)
 
-    # availability vectors are across time anyways, so append them at the end of the simulation
-    output_data["avail_icu"] = avail_icu
-    output_data["avail_ward"] = avail_ward
+# run outcomes_for_moc for an ensemble of forecasts in a single call, where di_mild and di_sev are
+# of dimension [E, S, D] (E ensemble members), so the per-day fields are of dimension [E, D, S]
+# and the capacity fields of dimension [E, D]
+def outcomes_for_ensemble(
+    moc,
+    di_mild,
+    di_sev,
+    risk,
+    legacy_duration=False,
+    fields=FIELDS,
+    profiler=None,
+    backend="numpy",
+    dtype=np.float64,
+):
+    assert di_mild.ndim == 3 and di_mild.shape == di_sev.shape
+    return outcomes_for_moc(
+        moc, di_mild, di_sev, risk, legacy_duration, fields, profiler, backend, dtype
+    )
+
 
-    return output_data
+# run outcomes_for_moc for several jurisdictions (a list of Jurisdiction records, or their names)
+# together, where di_mild and di_sev are of dimension [J, S, D] (and risk of [S] or [J, S]), so the
+# per-day fields are of dimension [J, D, S] and the capacity fields of dimension [J, D]; each
+# jurisdiction's capacities apply to its own forecast, as in model_of_care(moc_name, jurisdiction)
+def outcomes_for_jurisdictions(
+    moc_name,
+    jurisdictions,
+    di_mild,
+    di_sev,
+    risk,
+    legacy_duration=False,
+    fields=FIELDS,
+    profiler=None,
+    backend="numpy",
+    dtype=np.float64,
+):
+    assert di_mild.shape == di_sev.shape and di_mild.shape[:1] == (len(jurisdictions),)
+    moc = model_of_care_for_jurisdictions(moc_name, jurisdictions)
+    return outcomes_for_moc(
+        moc, di_mild, di_sev, risk, legacy_duration, fields, profiler, backend, dtype
+    )
@@ -0,0 +1,101 @@
+# PARAMETER_SWEEP
+#
+# evaluate a model of care for many samples of its parameters (eg a Latin hypercube for a
+# sensitivity analysis) in one vectorized simulation, where the samples are a leading axis [P]
+# inputs are:
+#    * moc: the model of care, as returned by model_of_care, whose other fields are fixed
+#    * samples: a table of parameter samples, a mapping (or numpy structured array) from the
+#               name of a field of moc to its [P] values, eg {"ward_to_ICU": [...], "LoS_ICU": [...]}
+#    * di_mild, di_sev, risk: a forecast, as taken by outcomes_for_moc (of dimension [S, D])
+#
+# every sampled field becomes a [P] array through the pathway (capacities, lengths of stay, ICU
+# fractions, ED capacity factors), except that the presentations to each setting are computed
+# once for each distinct combination of the routing fields (ROUTING_FIELDS), as they do not
+# depend on the others; fields derived from others in model_of_care (eg cap_Clinic of the
+# 'clinics' model of care) are not recomputed from the samples
+#
+# rather than per-day outputs, [P] arrays of summary statistics are returned:
+#  * total_deaths: the deaths over all strata and days
+#  * peak_excess_icu: the most patients turned away from ICU on any day
+#  * days_icu_at_capacity, days_ward_at_capacity: the days with no ICU or ward bed free
+# each sample's statistics are those of outcomes_for_moc with its values for the fields (and
+# the same dtype, eg np.float32, in which the deaths are also totalled)
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from .simulator import (
+    ROUTING_FIELDS,
+    Simulator,
+    presentation_demands,
+    presentation_matrix,
+)
+
+
+class Summary_Statistics:
+    def __init__(self, batch_shape, dtype=np.float64):
+        self.total_deaths = np.zeros(batch_shape, dtype)
+        self.peak_excess_icu = np.zeros(batch_shape, dtype=np.int64)
+        self.days_icu_at_capacity = np.zeros(batch_shape, dtype=np.int64)
+        self.days_ward_at_capacity = np.zeros(batch_shape, dtype=np.int64)
+
+    # summarise the outputs of day d, as taken by SimulationResult.record
+    def record(self, d, deaths, excess_icu, avail_icu, avail_ward, **others):
+        self.total_deaths += deaths.sum(axis=-1)
+        np.maximum(
+            self.peak_excess_icu, excess_icu.sum(axis=-1), out=self.peak_excess_icu
+        )
+        self.days_icu_at_capacity += avail_icu < 1
+        self.days_ward_at_capacity += avail_ward < 1
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def parameter_sweep(
+    moc, samples, di_mild, di_sev, risk, legacy_duration=False, dtype=np.float64
+):
+    names = samples.dtype.names if hasattr(samples, "dtype") else list(samples)
+    unknown = [name for name in names if not hasattr(moc, name)]
+    assert not unknown, f"not fields of the model of care: {unknown}"
+    num_strata, num_days = di_mild.shape
+    swept = SimpleNamespace(**vars(moc))
+    for name in names:
+        setattr(swept, name, np.asarray(samples[name]))
+    num_samples = len(getattr(swept, names[0]))
+
+    # presentations for each distinct routing of the samples
+    routing = np.stack(
+        [
+            np.broadcast_to(getattr(swept, name), [num_samples])
+            for name in ROUTING_FIELDS
+        ],
+        axis=-1,
+    )
+    distinct, routing_of_sample = np.unique(routing, axis=0, return_inverse=True)
+    routing_of_sample = routing_of_sample.reshape(-1)
+    demands = []
+    for values in distinct:
+        routed = SimpleNamespace(**vars(moc))
+        for name, value in zip(ROUTING_FIELDS, values):
+            setattr(routed, name, value)
+        pres = presentation_matrix(routed, np.zeros([num_strata], dtype))
+        pres.apply_days({"di_mild": di_mild, "di_sev": di_sev})
+        demands.append(presentation_demands(pres))
+    # each demand as [distinct routings, S, D]
+    demands = [np.stack(demand) for demand in zip(*demands)]
+
+    summary = Summary_Statistics([num_samples], dtype)
+    simulator = Simulator(
+        swept,
+        risk,
+        num_days,
+        [num_samples],
+        legacy_duration,
+        result=summary,
+        dtype=dtype,
+    )
+    for d in range(num_days):
+        simulator.advance(*(demand[routing_of_sample, :, d] for demand in demands))
+    return summary.as_dict()
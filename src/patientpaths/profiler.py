@@ -0,0 +1,42 @@
+# PROFILER
+#
+# records where the time goes in each step of the pathway: a Profiler passed to
+# outcomes_for_moc or a Simulator accumulates, for each step ('step1' presentations, 'step2'
+# ED capacity, 'step3' hospital admission, 'step4' ICU, 'step5' ward, 'step6' outpatients and
+# 'record' of the outputs), the wall time spent in it and the number of times it ran; the
+# memory allocated in a step is left to tracemalloc, filtering its snapshots on simulator.py
+#
+# the pathway calls start() as a step begins and lap(step) as each step ends, so
+# any object with those two methods can be passed instead to observe the steps; without one
+# the only cost is a check for None at the end of each step
+
+import time
+
+
+class Profiler:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.seconds = {}
+        self.calls = {}
+        self.last = None
+
+    def start(self):
+        self.last = self.clock()
+
+    # the end of a step, and the start of the next
+    def lap(self, step):
+        now = self.clock()
+        self.seconds[step] = self.seconds.get(step, 0.0) + (now - self.last)
+        self.calls[step] = self.calls.get(step, 0) + 1
+        self.last = now
+
+    # a table of the steps, with the share of the total time of each
+    def report(self):
+        total = sum(self.seconds.values()) or 1.0
+        lines = [f"{'step':8} {'seconds':>10} {'share':>7} {'calls':>8}"]
+        for step in sorted(self.seconds):
+            lines.append(
+                f"{step:8} {self.seconds[step]:10.4f} {self.seconds[step] / total:7.1%}"
+                f" {self.calls[step]:8}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,187 @@
+# RUN
+#
+# evaluate models of care for jurisdictions against forecasts, every combination being a
+# scenario, fanning the scenarios out across a pool of processes
+# a forecast is an .npz file holding the arrays di_mild and di_sev [S, D] and risk [S], as
+# taken by outcomes_for_moc; each forecast is unpacked once into .npy files under the output
+# directory which the worker processes memory-map, rather than being pickled to every task
+# each scenario's results are written as it completes, to an .npz file of the output fields
+# at <output>/<forecast>/<moc>_<jurisdiction>.npz, and the throughput is reported at the end
+# a forecast is named by its file name without .npz, so forecasts of the same file name (eg
+# a/f.npz and b/f.npz) are refused rather than overwriting each other's inputs and results
+#
+# backend and dtype (eg --backend jit, --dtype float32) are those of outcomes_for_moc
+#
+# by default every model of care in MOC_NAMES is evaluated for every jurisdiction in
+# JURISTICTIONS with known capacities (those without any would only produce nan)
+#
+# usage: patientpaths FORECAST.npz [FORECAST.npz ...] --output DIR [--moc NAME ...]
+#        [--jurisdiction NAME ...] [--processes N] [--field NAME ...] [--backend NAME]
+#        [--dtype float64|float32]
+
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, NamedTuple
+
+import numpy as np
+
+from .fused import BACKENDS
+from .model_of_care import JURISTICTIONS, MOC_NAMES, model_of_care
+from .outcomes_for_moc import outcomes_for_moc
+from .simulation_result import FIELDS
+
+FORECAST_ARRAYS = ("di_mild", "di_sev", "risk")
+DTYPES = {"float64": np.float64, "float32": np.float32}
+KNOWN_JURISDICTIONS = tuple(
+    j
+    for j in JURISTICTIONS
+    if not any(math.isnan(cap) for cap in (j.cap_ICU, j.cap_Ward, j.cap_ED, j.cap_GP))
+)
+
+
+class SweepSummary(NamedTuple):
+    paths: List[str]
+    seconds: float
+
+    @property
+    def throughput(self):
+        return len(self.paths) / self.seconds
+
+
+# write the arrays of a forecast to .npy files in a directory of their own, returning it
+def unpack_forecast(forecast, output_dir):
+    inputs_dir = os.path.join(output_dir, ".inputs", forecast_name(forecast))
+    os.makedirs(inputs_dir, exist_ok=True)
+    with np.load(forecast) as arrays:
+        for name in FORECAST_ARRAYS:
+            np.save(os.path.join(inputs_dir, name + ".npy"), arrays[name])
+    return inputs_dir
+
+
+def forecast_name(forecast):
+    return os.path.splitext(os.path.basename(forecast))[0]
+
+
+def check_forecast_names(forecasts):
+    names = [forecast_name(forecast) for forecast in forecasts]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    assert not duplicates, f"forecasts of the same name {duplicates}"
+
+
+# run one scenario against the memory-mapped arrays of a forecast, writing its results
+def run_scenario(
+    moc_name,
+    jurisdiction,
+    inputs_dir,
+    output_path,
+    fields=FIELDS,
+    backend="numpy",
+    dtype=np.float64,
+):
+    di_mild, di_sev, risk = (
+        np.load(os.path.join(inputs_dir, name + ".npy"), mmap_mode="r")
+        for name in FORECAST_ARRAYS
+    )
+    moc = model_of_care(moc_name, jurisdiction)
+    result = outcomes_for_moc(
+        moc, di_mild, di_sev, risk, fields=fields, backend=backend, dtype=dtype
+    )
+    np.savez(output_path, **result.as_dict())
+    return output_path
+
+
+# evaluate every model of care for every jurisdiction against every forecast, in a pool of
+# the given number of processes (None for one per cpu, 0 to run in this process), calling
+# progress(path) with each result as it is written
+def sweep(
+    forecasts,
+    output_dir,
+    moc_names=MOC_NAMES,
+    jurisdictions=KNOWN_JURISDICTIONS,
+    processes=None,
+    fields=FIELDS,
+    progress=None,
+    backend="numpy",
+    dtype=np.float64,
+):
+    check_forecast_names(forecasts)
+    start = time.perf_counter()
+    scenarios = []
+    for forecast in forecasts:
+        inputs_dir = unpack_forecast(forecast, output_dir)
+        results_dir = os.path.join(output_dir, forecast_name(forecast))
+        os.makedirs(results_dir, exist_ok=True)
+        for moc_name in moc_names:
+            for jurisdiction in jurisdictions:
+                output_path = os.path.join(
+                    results_dir, f"{moc_name}_{jurisdiction.name}.npz"
+                )
+                scenarios.append(
+                    (
+                        moc_name,
+                        jurisdiction,
+                        inputs_dir,
+                        output_path,
+                        fields,
+                        backend,
+                        dtype,
+                    )
+                )
+
+    paths = []
+    if processes == 0:
+        for scenario in scenarios:
+            paths.append(run_scenario(*scenario))
+            if progress is not None:
+                progress(paths[-1])
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            tasks = [pool.submit(run_scenario, *scenario) for scenario in scenarios]
+            for task in as_completed(tasks):
+                paths.append(task.result())
+                if progress is not None:
+                    progress(paths[-1])
+    return SweepSummary(paths=paths, seconds=time.perf_counter() - start)
+
+
+def main(argv=None):
+    by_name = {j.name: j for j in JURISTICTIONS}
+    parser = argparse.ArgumentParser(
+        prog="patientpaths",
+        description="Evaluate models of care for jurisdictions against forecasts.",
+    )
+    parser.add_argument("forecasts", nargs="+", metavar="FORECAST.npz")
+    parser.add_argument("-o", "--output", required=True, metavar="DIR")
+    parser.add_argument("--moc", action="append", choices=MOC_NAMES)
+    parser.add_argument("--jurisdiction", action="append", choices=sorted(by_name))
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--field", action="append", choices=FIELDS)
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy")
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default="float64")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    def progress(path):
+        elapsed = time.perf_counter() - start
+        print(f"{path} ({elapsed:.1f}s)", flush=True)
+
+    summary = sweep(
+        args.forecasts,
+        args.output,
+        moc_names=args.moc or MOC_NAMES,
+        jurisdictions=[by_name[j] for j in args.jurisdiction or ()]
+        or KNOWN_JURISDICTIONS,
+        processes=args.processes,
+        fields=args.field or FIELDS,
+        progress=progress,
+        backend=args.backend,
+        dtype=DTYPES[args.dtype],
+    )
+    print(
+        f"{len(summary.paths)} scenarios in {summary.seconds:.1f}s"
+        f" ({summary.throughput:.2f} scenarios/s)"
+    )
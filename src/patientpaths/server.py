@@ -0,0 +1,393 @@
+# SERVER
+#
+# a long-lived local server of what-if scenarios (a model of care for a jurisdiction, with some
+# of its capacities changed) against forecasts held in memory, for a dashboard that asks for
+# many small scenarios, so that none of them pays for starting python and numpy, building the
+# model of care or computing the presentations of its forecast
+# it speaks HTTP/1.1 (with keep-alive) over localhost TCP, or a unix socket:
+#    * POST /scenario, with a JSON object of
+#         - forecast: the name of a forecast the server was started with (its file name without
+#           .npz, as in run.py, whose di_mild, di_sev [S, D] and risk [S] are simulated)
+#         - moc: a model of care in MOC_NAMES
+#         - jurisdiction: the name of a jurisdiction with known capacities (KNOWN_JURISDICTIONS)
+#         - capacities (optional): new values of capacity fields of the model of care (see
+#           CAPACITIES), eg {"cap_ICU": 30}, each finite and not negative (NaN and Infinity,
+#           which JSON is read with, are refused), and cap_Ward positive
+#         - legacy_duration (optional): as taken by outcomes_for_moc
+#         - fields (optional): the output fields to return, by default every one of FIELDS
+#      answers with the outputs of outcomes_for_moc as the arrays of an .npz file (decode_result
+#      reads them back into a SimulationResult), or with a JSON {"error": ...} if it is refused
+#    * GET /metrics answers with a JSON object of the counts of requests, errors and batches,
+#      the mean and histogram of the batch sizes, and percentiles of the latency of the recent
+#      requests and of the time spent simulating the recent batches (see Server_Metrics)
+#
+# the presentations to each setting depend only on the forecast and model of care, not on the
+# jurisdiction or any capacity, so those of every forecast and model of care are computed as the
+# server starts and kept; the scenarios that arrive within window seconds of the first of them
+# and share a forecast, model of care, legacy_duration and fields are then simulated together
+# (up to max_batch of them) as the leading axis of one outcomes_for_demands, as jurisdictions
+# are in outcomes_for_jurisdictions, so each result is exactly that of outcomes_for_moc alone
+# the batches are simulated one at a time in a worker thread, while requests are still received;
+# should a batch fail, its scenarios are simulated again one at a time, so that a scenario is
+# only answered with an error of its own
+# with backend="jit" the day loop is compiled (see fused.py) by a simulation as the server starts
+# other fields derived from a capacity (eg cap_Clinic of the 'clinics' model of care) are not
+# recomputed when it is changed
+#
+# usage: patientpaths-server FORECAST.npz [FORECAST.npz ...] [--host HOST] [--port PORT]
+#        [--unix PATH] [--window-ms MS] [--max-batch N] [--backend NAME]
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from .capacity_planning import RESOURCES
+from .fused import BACKENDS
+from .model_of_care import MOC_NAMES, model_of_care, stacked_models_of_care
+from .outcomes_for_moc import outcomes_for_demands
+from .run import (
+    FORECAST_ARRAYS,
+    KNOWN_JURISDICTIONS,
+    check_forecast_names,
+    forecast_name,
+)
+from .simulation_result import FIELDS, SimulationResult
+from .simulator import presentation_demands, presentation_matrix
+
+HOST = "127.0.0.1"
+PORT = 8750
+WINDOW_SECONDS = 0.005
+MAX_BATCH = 64
+METRICS_WINDOW = 1024
+CAPACITIES = tuple("cap_" + resource for resource in RESOURCES)
+JURISDICTION_NAMES = tuple(j.name for j in KNOWN_JURISDICTIONS)
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Server Error"}
+
+
+class Scenario(NamedTuple):
+    forecast: str
+    moc: str
+    jurisdiction: str
+    capacities: Tuple[Tuple[str, float], ...] = ()
+    legacy_duration: bool = False
+    fields: Tuple[str, ...] = FIELDS
+
+    # the scenarios that can be simulated together
+    @property
+    def batch_key(self):
+        return self.forecast, self.moc, self.legacy_duration, self.fields
+
+
+def check(condition, message):
+    if not condition:
+        raise ValueError(message)
+
+
+# the Scenario of the JSON body of a request, raising ValueError for any it cannot be
+def parse_scenario(body, forecast_names):
+    request = json.loads(body)
+    check(isinstance(request, dict), "a scenario is a JSON object")
+    unknown = set(request) - set(Scenario._fields)
+    check(not unknown, f"unknown keys {sorted(unknown)}")
+    missing = {"forecast", "moc", "jurisdiction"} - set(request)
+    check(not missing, f"missing keys {sorted(missing)}")
+    check(request["forecast"] in tuple(forecast_names), "unknown forecast")
+    check(request["moc"] in MOC_NAMES, "unknown model of care")
+    check(request["jurisdiction"] in JURISDICTION_NAMES, "unknown jurisdiction")
+    capacities = request.get("capacities", {})
+    check(isinstance(capacities, dict), "capacities is a JSON object")
+    for name, value in capacities.items():
+        check(name in CAPACITIES, f"unknown capacity {name}")
+        check(
+            isinstance(value, (int, float)) and not isinstance(value, bool),
+            f"{name} is not a number",
+        )
+        check(math.isfinite(value) and value >= 0, f"{name} is not finite and >= 0")
+        check(name != "cap_Ward" or value > 0, "cap_Ward is not positive")
+    legacy_duration = request.get("legacy_duration", False)
+    check(isinstance(legacy_duration, bool), "legacy_duration is true or false")
+    fields = request.get("fields", list(FIELDS))
+    check(
+        isinstance(fields, list) and all(field in FIELDS for field in fields),
+        "fields is a list of output fields",
+    )
+    return Scenario(
+        request["forecast"],
+        request["moc"],
+        request["jurisdiction"],
+        tuple(sorted(capacities.items())),
+        legacy_duration,
+        tuple(field for field in FIELDS if field in fields),
+    )
+
+
+def encode_result(result):
+    content = io.BytesIO()
+    np.savez(content, **result.as_dict())
+    return content.getvalue()
+
+
+def decode_result(content):
+    with np.load(io.BytesIO(content)) as arrays:
+        return SimulationResult({name: arrays[name] for name in arrays.files})
+
+
+# the percentiles of recent durations, in milliseconds
+def percentiles(seconds):
+    if not seconds:
+        return {}
+    p50, p90, p99 = np.percentile(np.array(seconds) * 1000, [50, 90, 99])
+    return {"p50": p50, "p90": p90, "p99": p99, "max": max(seconds) * 1000}
+
+
+# the requests served (from receipt of the scenario to its result) and the batches simulated,
+# with the durations of the latest window of each
+class Server_Metrics:
+    def __init__(self, window=METRICS_WINDOW):
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.scenarios = 0
+        self.batch_sizes = {}
+        self.latencies = deque(maxlen=window)
+        self.simulation_seconds = deque(maxlen=window)
+
+    def record_request(self, seconds):
+        self.requests += 1
+        self.latencies.append(seconds)
+
+    def record_batch(self, size, seconds):
+        self.batches += 1
+        self.scenarios += size
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+        self.simulation_seconds.append(seconds)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batches,
+            "mean_batch_size": self.scenarios / max(self.batches, 1),
+            "batch_sizes": {
+                str(size): n for size, n in sorted(self.batch_sizes.items())
+            },
+            "latency_ms": percentiles(self.latencies),
+            "simulation_ms": percentiles(self.simulation_seconds),
+        }
+
+
+# forecasts maps the name of each forecast to its di_mild, di_sev and risk arrays
+class Scenario_Server:
+    def __init__(
+        self,
+        forecasts,
+        window=WINDOW_SECONDS,
+        max_batch=MAX_BATCH,
+        backend="numpy",
+    ):
+        assert backend in BACKENDS, f"unknown backend {backend}"
+        assert max_batch >= 1
+        self.forecasts = forecasts
+        self.window = window
+        self.max_batch = max_batch
+        self.backend = backend
+        self.metrics = Server_Metrics()
+        self.demands = {}
+        for name, (di_mild, di_sev, risk) in forecasts.items():
+            for moc_name in MOC_NAMES:
+                moc = model_of_care(moc_name, KNOWN_JURISDICTIONS[0])
+                pres = presentation_matrix(moc, np.zeros([len(risk)]))
+                pres.apply_days({"di_mild": di_mild, "di_sev": di_sev})
+                self.demands[name, moc_name] = presentation_demands(pres)
+                # simulate a day, so that the compiled day loop is ready
+                outcomes_for_demands(
+                    moc,
+                    risk,
+                    [demand[..., :1] for demand in self.demands[name, moc_name]],
+                    backend=backend,
+                )
+        self.pending = {}
+        self.timers = {}
+        self.running = set()
+        self.executor = ThreadPoolExecutor(1)
+
+    # the results of a batch of scenarios of the same batch_key
+    def simulate(self, scenarios):
+        forecast, moc_name, legacy_duration, fields = scenarios[0].batch_key
+        mocs = []
+        for scenario in scenarios:
+            mocs.append(model_of_care(moc_name, scenario.jurisdiction))
+            for name, value in scenario.capacities:
+                setattr(mocs[-1], name, value)
+        result = outcomes_for_demands(
+            stacked_models_of_care(mocs),
+            self.forecasts[forecast][2],
+            [
+                np.broadcast_to(demand, (len(scenarios),) + demand.shape)
+                for demand in self.demands[forecast, moc_name]
+            ],
+            legacy_duration,
+            fields,
+            backend=self.backend,
+        )
+        return [
+            SimulationResult({field: values[b] for field, values in result.items()})
+            for b in range(len(scenarios))
+        ]
+
+    # the result of a scenario, once it is simulated in a batch
+    async def evaluate(self, scenario):
+        loop = asyncio.get_event_loop()
+        key = scenario.batch_key
+        batch = self.pending.setdefault(key, [])
+        batch.append((scenario, loop.create_future()))
+        if len(batch) == 1:
+            self.timers[key] = loop.call_later(self.window, self.flush, key)
+        if len(batch) == self.max_batch:
+            self.flush(key)
+        return await batch[-1][1]
+
+    # start simulating the scenarios pending of a batch_key
+    def flush(self, key):
+        self.timers.pop(key).cancel()
+        task = asyncio.ensure_future(self.run_batch(self.pending.pop(key)))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def run_batch(self, batch):
+        loop = asyncio.get_event_loop()
+        start = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.simulate, [scenario for scenario, _ in batch]
+            )
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0][1].set_exception(error)
+            else:
+                for scenario in batch:
+                    await self.run_batch([scenario])
+            return
+        self.metrics.record_batch(len(batch), time.perf_counter() - start)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    # the status, content type and content of the response to a request
+    async def respond(self, method, path, body):
+        if (method, path) == ("GET", "/metrics"):
+            return 200, "application/json", json.dumps(self.metrics.as_dict())
+        if (method, path) != ("POST", "/scenario"):
+            return self.error(404, "not found")
+        start = time.perf_counter()
+        try:
+            scenario = parse_scenario(body, self.forecasts)
+        except ValueError as error:
+            return self.error(400, error)
+        try:
+            result = await self.evaluate(scenario)
+        except Exception as error:
+            return self.error(500, error)
+        self.metrics.record_request(time.perf_counter() - start)
+        return 200, "application/octet-stream", encode_result(result)
+
+    def error(self, status, message):
+        self.metrics.errors += 1
+        return status, "application/json", json.dumps({"error": str(message)})
+
+    # serve the requests of a connection in turn, until it is closed
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                line = await reader.readline()
+                while line.strip():
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                    line = await reader.readline()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, content_type, content = await self.respond(method, path, body)
+                if isinstance(content, str):
+                    content = content.encode()
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {STATUS[status]}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(content)}\r\n\r\n"
+                    ).encode("latin-1")
+                    + content
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # a malformed request, or one cut short
+        finally:
+            writer.close()
+
+    # listen on host and port, or on the unix socket at path if given
+    async def start(self, host=HOST, port=PORT, path=None):
+        if path is None:
+            return await asyncio.start_server(self.handle, host, port)
+        return await asyncio.start_unix_server(self.handle, path)
+
+    # serve until cancelled, announcing the address listened on (the port bound, if port is 0)
+    async def serve_forever(self, host=HOST, port=PORT, path=None):
+        listener = await self.start(host, port, path)
+        if path is None:
+            host, port = listener.sockets[0].getsockname()[:2]
+        print(f"serving on {path or f'http://{host}:{port}'}", flush=True)
+        try:
+            await asyncio.get_event_loop().create_future()
+        finally:
+            listener.close()
+            await listener.wait_closed()
+
+
+def load_forecasts(paths):
+    check_forecast_names(paths)
+    forecasts = {}
+    for path in paths:
+        with np.load(path) as arrays:
+            forecasts[forecast_name(path)] = tuple(
+                arrays[name] for name in FORECAST_ARRAYS
+            )
+    return forecasts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="patientpaths-server",
+        description="Serve what-if scenarios of models of care against forecasts.",
+    )
+    parser.add_argument("forecasts", nargs="+", metavar="FORECAST.npz")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", metavar="PATH")
+    parser.add_argument("--window-ms", type=float, default=WINDOW_SECONDS * 1000)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy")
+    args = parser.parse_args(argv)
+
+    server = Scenario_Server(
+        load_forecasts(args.forecasts),
+        args.window_ms / 1000,
+        args.max_batch,
+        args.backend,
+    )
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(server.serve_forever(args.host, args.port, args.unix))
+    finally:
+        loop.close()
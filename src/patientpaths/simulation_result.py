@@ -0,0 +1,83 @@
+# SIMULATION_RESULT
+#
+# the outputs of a pathways simulation, held as one preallocated contiguous array per
+# field which the day loop writes into in place, rather than lists of per-day arrays
+# fields of the strata are of dimension [D, S] and fields of a resource's capacity of
+# dimension [D], each with any leading (eg ensemble) axes of the simulation in front
+# only the selected fields are allocated, values recorded for any other field are dropped
+# a SimulationResult is a read-only mapping of field name to array, as the dict returned
+# by earlier versions of outcomes_for_moc, and as_dict() gives a plain dict of the arrays
+# the admissions and excesses are counts of patients (int32), and the other fields are of the
+# dtype of the simulation (float64 unless eg float32 is chosen)
+
+from collections.abc import Mapping
+
+import numpy as np
+
+STRATA_FIELDS = (
+    "deaths",
+    "excess_icu",
+    "excess_ward",
+    "excess_ed_sev",
+    "excess_ed_mld",
+    "excess_clinic_mld",
+    "excess_clinic_sev",
+    "excess_gp",
+    "admit_icu",
+    "admit_ward",
+    "admit_ed_sev",
+    "admit_ed_mld",
+    "admit_clinic_sev",
+    "admit_clinic_mld",
+    "admit_gp",
+)
+CAPACITY_FIELDS = ("avail_ed", "avail_clinic", "avail_gp", "avail_icu", "avail_ward")
+FIELDS = STRATA_FIELDS + CAPACITY_FIELDS
+
+
+def field_dtype(field, dtype=np.float64):
+    if field.startswith(("admit_", "excess_")):
+        return np.int32
+    return dtype
+
+
+class SimulationResult(Mapping):
+    # a result over the given arrays of its fields
+    def __init__(self, data):
+        self.data = {field: data[field] for field in FIELDS if field in data}
+        # views with days on the first axis, to write a day at a time
+        self.days = {
+            field: np.moveaxis(values, -2 if field in STRATA_FIELDS else -1, 0)
+            for field, values in self.data.items()
+        }
+
+    # a result of zeros for the selected fields of a simulation of the given dimensions
+    @classmethod
+    def zeros(cls, batch_shape, num_strata, num_days, fields=FIELDS, dtype=np.float64):
+        unknown = set(fields) - set(FIELDS)
+        assert not unknown, f"unknown output fields {sorted(unknown)}"
+        data = {}
+        for field in fields:
+            shape = [*batch_shape, num_days]
+            if field in STRATA_FIELDS:
+                shape.append(num_strata)
+            data[field] = np.zeros(shape, dtype=field_dtype(field, dtype))
+        return cls(data)
+
+    # write the values of each field on day d
+    def record(self, d, **values):
+        for field, value in values.items():
+            if field in self.days:
+                self.days[field][d] = value
+
+    def __getitem__(self, field):
+        return self.data[field]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def as_dict(self):
+        return dict(self.data)
@@ -0,0 +1,329 @@
+# SIMULATOR
+#
+# the pathway of outcomes_for_moc as an object holding the state of the health system between
+# days, so a simulation can be advanced one day at a time, eg as a live feed of incidence
+# arrives, and its state snapshot on any day and later restored, eg to recompute only the
+# days from which a revised forecast differs
+#
+# Simulator(moc, risk, num_days) simulates up to num_days days of the strata identified by risk,
+# with any leading (eg ensemble) axes given by batch_shape; each call of step(di_mild_day,
+# di_sev_day) simulates the next day from the [S] (or [..., S]) incidence of that day, and run()
+# steps through [S, n] (or [..., S, n]) incidence n days at a time
+# the outputs of each day are written into result, a SimulationResult over all num_days days
+# (or any object with its record(d, **values) method, eg to summarise the outputs instead);
+# restoring a snapshot rewinds the state to its day, and the days from then on are overwritten
+# as they are stepped again (as the outputs of a day only depend on the state on that day)
+#
+# outcomes_for_moc uses the same pathway through advance(), with the demands of every day
+# computed up front, and the two produce identical results
+#
+# a Profiler (see profiler.py) passed as profiler records the time spent in each step
+#
+# with rng (anything with a binomial(n, p) method drawing whole patients, eg the Replicate_Streams
+# of monte_carlo.py) the simulation is stochastic: every transition of the presentations, the
+# split of the admitted severe cases into ICU and ward, and the deaths in and out of ICU are
+# binomial draws of whole patients, rather than fractions of patients truncated on admission;
+# a snapshot then holds the position of rng too (its state, which must be settable, as that of
+# Replicate_Streams), so that restoring it replays the same draws
+#
+# dtype is the floating point type of the presentations, the ICU fractions, and the deaths and
+# availability outputs (eg np.float32 to halve their memory), see outcomes_for_moc
+#
+# the fields of the model of care may be arrays over the leading axes of the simulation rather
+# than numbers, so that eg capacities, lengths of stay or the ICU fractions differ between them
+
+import copy
+from typing import Any, Dict, NamedTuple
+
+import numpy as np
+
+from .components import Bed_Occupancy, allocate
+from .Presentation_Matrix import Presentation_Matrix
+from .simulation_result import FIELDS, SimulationResult
+
+# the fields of the model of care that route presentations to each setting
+ROUTING_FIELDS = (
+    "mild_to_GP",
+    "mild_to_ED",
+    "mild_to_Clinic",
+    "mild_GP_rpt_ED",
+    "mild_GP_rpt_Clinic",
+    "mild_ED_rpt_GP",
+    "mild_Clinic_rpt_GP",
+    "sev_frac_early",
+    "sev_early_to_GP",
+    "sev_early_to_ED",
+    "sev_early_to_Clinic",
+    "sev_frac_late",
+    "sev_late_to_ED",
+    "sev_late_to_Clinic",
+)
+
+
+# construct the matrix calculating what presentations appear before the healthsystem
+def presentation_matrix(moc, default):
+    pres = Presentation_Matrix()
+    pres.set_default(default)
+    pres.transition("di_mild", "mld_new_GP", moc.mild_to_GP)
+    pres.transition("di_mild", "mld_new_ED", moc.mild_to_ED)
+    pres.transition("di_mild", "mld_new_Clinic", moc.mild_to_Clinic)
+    pres.transition("mld_new_GP", "mld_rpt_ED", moc.mild_GP_rpt_ED)
+    pres.transition("mld_new_GP", "mld_rpt_Clinic", moc.mild_GP_rpt_Clinic)
+    pres.transition("mld_new_ED", "mld_rpt_GP", moc.mild_ED_rpt_GP)
+    pres.transition("mld_rpt_ED", "mld_rpt_GP", moc.mild_ED_rpt_GP)
+    pres.transition("mld_new_Clinic", "mld_rpt_GP", moc.mild_Clinic_rpt_GP)
+    pres.transition("mld_rpt_Clinic", "mld_rpt_GP", moc.mild_Clinic_rpt_GP)
+    pres.transition("di_sev", "sev_new_early", moc.sev_frac_early)
+    pres.transition(
+        "di_sev", "sev_new_early_GP", moc.sev_frac_early * moc.sev_early_to_GP
+    )
+    pres.transition(
+        "di_sev", "sev_new_early_ED", moc.sev_frac_early * moc.sev_early_to_ED
+    )
+    pres.transition(
+        "di_sev", "sev_new_early_Clinic", moc.sev_frac_early * moc.sev_early_to_Clinic
+    )
+    pres.transition("di_sev", "sev_new_late", moc.sev_frac_late)
+    pres.transition("di_sev", "sev_new_late_ED", moc.sev_frac_late * moc.sev_late_to_ED)
+    pres.transition(
+        "di_sev", "sev_new_late_Clinic", moc.sev_frac_late * moc.sev_late_to_Clinic
+    )
+    pres.transition("sev_new_early", "sev_rpt_late_ED", moc.sev_late_to_ED)
+    return pres
+
+
+# the demand for each service from the presentations, in the order taken by advance()
+def presentation_demands(pres):
+    return (
+        pres["sev_rpt_late_Clinic"] + pres["sev_new_late_Clinic"],
+        pres["sev_rpt_late_ED"] + pres["sev_new_late_ED"],
+        pres["mld_new_Clinic"] + pres["mld_rpt_Clinic"],
+        pres["mld_new_ED"] + pres["mld_rpt_ED"],
+        pres["mld_new_GP"]
+        + pres["mld_rpt_GP"]
+        + pres["excess_clinic_mld"]
+        + pres["excess_clinic_sev"]
+        + pres["excess_ed_mld"]
+        + pres["excess_ed_sev"],
+    )
+
+
+# the fractions of each stratum's admissions needing ICU, and dying in and out of ICU
+def icu_fractions(moc, risk):
+    # Identify cohorts with increased risk of ICU admission and death.
+    # (the fractions may differ between the simulations of the leading axes)
+    high_risk = np.asarray(risk) > 1
+    frac_ward_to_ICU = np.where(
+        high_risk,
+        np.expand_dims(moc.ward_to_ICU_highrisk, -1),
+        np.expand_dims(moc.ward_to_ICU, -1),
+    )
+    frac_ICU_to_death = np.where(
+        high_risk,
+        np.expand_dims(moc.ICU_to_death_highrisk, -1),
+        np.expand_dims(moc.ICU_to_death, -1),
+    )
+    # Halve the survival rate for cases that require ICU admission but cannot
+    # be admitted into an ICU.
+    frac_noICU_to_death = 1 - 0.5 * (1 - frac_ICU_to_death)
+    return frac_ward_to_ICU, frac_ICU_to_death, frac_noICU_to_death
+
+
+class Snapshot(NamedTuple):
+    day: int
+    frac_ward_avail: Any
+    presentations: Dict[str, np.ndarray]
+    beds_icu: Bed_Occupancy
+    beds_ward: Bed_Occupancy
+    rng_state: Any = None
+
+
+class Simulator:
+    def __init__(
+        self,
+        moc,
+        risk,
+        num_days,
+        batch_shape=(),
+        legacy_duration=False,
+        fields=FIELDS,
+        profiler=None,
+        result=None,
+        rng=None,
+        dtype=np.float64,
+    ):
+        num_strata = np.shape(risk)[-1]
+        self.moc = moc
+        self.profiler = profiler
+        self.rng = rng
+        self.dtype = dtype
+        self.num_strata = num_strata
+        self.day = 0
+
+        (
+            self.frac_ward_to_ICU,
+            self.frac_ICU_to_death,
+            self.frac_noICU_to_death,
+        ) = (fraction.astype(dtype) for fraction in icu_fractions(moc, risk))
+        # misc stuff
+        self.frac_ward_avail = 1
+        self.beds_icu = Bed_Occupancy(
+            moc.cap_ICU, moc.LoS_ICU, num_days, batch_shape, legacy_duration
+        )
+        self.beds_ward = Bed_Occupancy(
+            moc.cap_Ward, moc.LoS_Ward, num_days, batch_shape, legacy_duration
+        )
+
+        self.pres = presentation_matrix(
+            moc, np.zeros([*batch_shape, num_strata], dtype=dtype)
+        )
+        if result is None:
+            result = SimulationResult.zeros(
+                batch_shape, num_strata, num_days, fields, dtype
+            )
+        self.result = result
+
+    # simulate the next day from that day's mild and severe incidence
+    def step(self, di_mild_day, di_sev_day):
+        if self.profiler is not None:
+            self.profiler.start()
+        # Daily presentations in each setting. (steps1 and steps1a)
+        if self.rng is not None:
+            # each simulation draws its own presentations of the same incidence
+            di_mild_day = np.broadcast_to(di_mild_day, self.pres.default.shape)
+            di_sev_day = np.broadcast_to(di_sev_day, self.pres.default.shape)
+        self.pres["di_mild"] = np.asarray(di_mild_day, self.dtype)
+        self.pres["di_sev"] = np.asarray(di_sev_day, self.dtype)
+        self.pres.apply(self.rng)
+        if self.profiler is not None:
+            self.profiler.lap("step1")
+        self.advance(*presentation_demands(self.pres))
+
+    # simulate the days of the incidence arrays, which have days on the last axis
+    def run(self, di_mild, di_sev):
+        for d in range(np.shape(di_mild)[-1]):
+            self.step(di_mild[..., d], di_sev[..., d])
+
+    # simulate the next day from that day's demand for each service
+    def advance(
+        self,
+        demand_clinic_sev,
+        demand_ed_sev,
+        demand_clinic_mld,
+        demand_ed_mld,
+        demand_gp,
+    ):
+        moc, num_strata, d, profiler, rng, dtype = (
+            self.moc,
+            self.num_strata,
+            self.day,
+            self.profiler,
+            self.rng,
+            self.dtype,
+        )
+        if profiler is not None:
+            profiler.start()
+        # ED consultation capacity, given ward utilisation. (step2)
+        avail_ed = moc.cap_ED * np.minimum(
+            moc.lm_ED_cap_E1
+            + (1 - moc.lm_ED_cap_E1) * self.frac_ward_avail / moc.lm_ED_cap_W0,
+            1,
+        )
+        if profiler is not None:
+            profiler.lap("step2")
+        # Hospital admissions -- how many can we admit? (step3)
+        admit_clinic_sev, excess_clinic_sev, avail_clinic = allocate(
+            num_strata, demand_clinic_sev, moc.cap_Clinic
+        )
+        admit_ed_sev, excess_ed_sev, avail_ed = allocate(
+            num_strata, demand_ed_sev, moc.cap_ED
+        )
+        if profiler is not None:
+            profiler.lap("step3")
+        # Hospital admissions -- how many can we put in ICU beds? (step4)
+        # (the counts of patients are int32, so the products are computed in dtype
+        # rather than promoted to float64)
+        admitted = admit_clinic_sev + admit_ed_sev
+        if rng is None:
+            req_icu = np.multiply(admitted, self.frac_ward_to_ICU, dtype=dtype)
+        else:
+            req_icu = rng.binomial(admitted, self.frac_ward_to_ICU)
+        try_ward = np.subtract(admitted, req_icu, dtype=np.result_type(req_icu))
+        admit_icu, excess_icu = self.beds_icu.admit(d, req_icu)
+        try_ward = np.add(try_ward, excess_icu, dtype=try_ward.dtype)
+        if rng is None:
+            deaths = np.multiply(
+                admit_icu, self.frac_ICU_to_death, dtype=dtype
+            ) + np.multiply(excess_icu, self.frac_noICU_to_death, dtype=dtype)
+        else:
+            deaths = rng.binomial(admit_icu, self.frac_ICU_to_death) + rng.binomial(
+                excess_icu, self.frac_noICU_to_death
+            )
+        if profiler is not None:
+            profiler.lap("step4")
+        # Hospital admissions -- how many can we put in ward beds? (step5)
+        admit_ward, excess_ward = self.beds_ward.admit(d, try_ward)
+        self.frac_ward_avail = np.divide(self.beds_ward.free, moc.cap_Ward, dtype=dtype)
+        if profiler is not None:
+            profiler.lap("step5")
+        # Out-patient presentations and treatment. (step6)
+        admit_clinic_mld, excess_clinic_mld, avail_clinic = allocate(
+            num_strata, demand_clinic_mld, avail_clinic
+        )
+        admit_ed_mld, excess_ed_mld, avail_ed = allocate(
+            num_strata, demand_ed_mld, avail_ed
+        )
+        admit_gp, excess_gp, avail_gp = allocate(num_strata, demand_gp, moc.cap_GP)
+        if profiler is not None:
+            profiler.lap("step6")
+
+        # populate the output container fields for this day
+        self.result.record(
+            d,
+            deaths=deaths,
+            excess_icu=excess_icu,
+            excess_ward=excess_ward,
+            excess_ed_sev=excess_ed_sev,
+            excess_ed_mld=excess_ed_mld,
+            excess_clinic_mld=excess_clinic_mld,
+            excess_clinic_sev=excess_clinic_sev,
+            excess_gp=excess_gp,
+            admit_icu=admit_icu,
+            admit_ward=admit_ward,
+            admit_ed_sev=admit_ed_sev,
+            admit_ed_mld=admit_ed_mld,
+            admit_clinic_sev=admit_clinic_sev,
+            admit_clinic_mld=admit_clinic_mld,
+            admit_gp=admit_gp,
+            avail_ed=avail_ed,
+            avail_clinic=avail_clinic,
+            avail_gp=avail_gp,
+            avail_icu=self.beds_icu.free,
+            avail_ward=self.beds_ward.free,
+        )
+        if profiler is not None:
+            profiler.lap("record")
+        self.day += 1
+
+    # a copy of the state of the simulation, from which to resume on the next day
+    def snapshot(self):
+        return copy.deepcopy(
+            Snapshot(
+                day=self.day,
+                frac_ward_avail=self.frac_ward_avail,
+                presentations=self.pres.values,
+                beds_icu=self.beds_icu,
+                beds_ward=self.beds_ward,
+                rng_state=None if self.rng is None else self.rng.state,
+            )
+        )
+
+    def restore(self, snapshot):
+        snapshot = copy.deepcopy(snapshot)
+        self.day = snapshot.day
+        self.frac_ward_avail = snapshot.frac_ward_avail
+        self.pres.values = snapshot.presentations
+        self.beds_icu = snapshot.beds_icu
+        self.beds_ward = snapshot.beds_ward
+        if self.rng is not None:
+            self.rng.state = snapshot.rng_state
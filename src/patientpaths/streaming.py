@@ -0,0 +1,156 @@
+# STREAMING
+#
+# run outcomes_for_moc on forecasts too large to hold in memory, from .npy files of di_mild and
+# di_sev [S, D] (or [E, S, D] for an ensemble of E members in one file, or any leading axes)
+# to one .npy file per output field, so the memory used is proportional to the number of strata
+# rather than to the strata times the days times the outputs
+# inputs are:
+#    * moc, risk: a model of care and the risk of each stratum, as taken by outcomes_for_moc
+#    * di_mild_path, di_sev_path: the .npy files of the forecast (see csv_to_npy for a .csv)
+#    * output_dir: the directory of the <field>.npy output files, which are overwritten
+#
+# the incidence is read chunk_days days at a time, each chunk from a fresh memory map of the
+# input files which is closed once its days are copied out, and the simulation is stepped
+# through them a day at a time (see Simulator); the outputs of those days are held in a buffer
+# of chunk_days days, then written into the preallocated output files the same way
+# the outputs are as those of outcomes_for_moc (with its dtype option, eg np.float32 to halve the
+# size of the deaths and avail_* files), and are returned as a SimulationResult of the output
+# files memory-mapped (read-only)
+#
+# csv_to_npy(csv_path) converts a .csv file of a forecast, a row of the days of each stratum,
+# to an .npy file beside it a row at a time, once: it is reused while newer than the .csv
+# blank lines (eg a trailing one) are skipped, and every row must have the days of the first;
+# the .npy only appears once every row is converted
+
+import os
+
+import numpy as np
+
+from .simulation_result import FIELDS, STRATA_FIELDS, SimulationResult, field_dtype
+from .simulator import Simulator
+
+CHUNK_DAYS = 64
+
+
+# the values of each row of a .csv file, skipping blank lines
+def csv_rows(csv_path):
+    with open(csv_path) as rows:
+        for row in rows:
+            if row.strip():
+                yield row.split(",")
+
+
+def csv_to_npy(csv_path, npy_path=None, dtype=np.float64):
+    if npy_path is None:
+        npy_path = os.path.splitext(csv_path)[0] + ".npy"
+    if os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(
+        csv_path
+    ):
+        return npy_path
+    num_strata = num_days = 0
+    for row in csv_rows(csv_path):
+        if num_strata == 0:
+            num_days = len(row)
+        assert (
+            len(row) == num_days
+        ), f"{csv_path}: row {num_strata + 1} has {len(row)} days, not {num_days}"
+        num_strata += 1
+    assert num_strata > 0, f"{csv_path}: no rows"
+    # written alongside then renamed into place, so a cell that is not a number leaves no
+    # partial .npy to be reused as if it were converted
+    partial = f"{npy_path}.partial-{os.getpid()}"
+    try:
+        values = np.lib.format.open_memmap(
+            partial, mode="w+", dtype=dtype, shape=(num_strata, num_days)
+        )
+        for s, row in enumerate(csv_rows(csv_path)):
+            values[s] = np.array(row, dtype=np.float64)
+        values.flush()
+        del values
+        os.replace(partial, npy_path)
+    except BaseException:
+        os.remove(partial)
+        raise
+    return npy_path
+
+
+# a recorder of the outputs of a simulation (as taken by SimulationResult.record) into the
+# .npy file of each field in output_dir, through a buffer of chunk_days days
+# the days must be recorded in order
+class Npy_Writer:
+    def __init__(
+        self,
+        output_dir,
+        batch_shape,
+        num_strata,
+        num_days,
+        fields=FIELDS,
+        chunk_days=CHUNK_DAYS,
+        dtype=np.float64,
+    ):
+        self.num_days = num_days
+        self.chunk_days = chunk_days
+        self.paths = {
+            field: os.path.join(output_dir, field + ".npy") for field in fields
+        }
+        for field, path in self.paths.items():
+            shape = [*batch_shape, num_days]
+            if field in STRATA_FIELDS:
+                shape.append(num_strata)
+            np.lib.format.open_memmap(
+                path, "w+", field_dtype(field, dtype), tuple(shape)
+            )
+        self.buffer = SimulationResult.zeros(
+            batch_shape, num_strata, chunk_days, fields, dtype
+        )
+        self.start = 0
+
+    def record(self, d, **values):
+        self.buffer.record(d - self.start, **values)
+        if d + 1 - self.start == self.chunk_days or d + 1 == self.num_days:
+            self.write(d + 1)
+
+    # write the buffered days up to stop into the output files
+    def write(self, stop):
+        days, buffered = slice(self.start, stop), slice(0, stop - self.start)
+        for field, values in self.buffer.days.items():
+            output = np.load(self.paths[field], mmap_mode="r+")
+            days_of_output = SimulationResult({field: output}).days[field]
+            days_of_output[days] = values[buffered]
+            output.flush()
+        self.start = stop
+
+    def result(self):
+        return SimulationResult(
+            {field: np.load(path, mmap_mode="r") for field, path in self.paths.items()}
+        )
+
+
+def outcomes_for_files(
+    moc,
+    di_mild_path,
+    di_sev_path,
+    risk,
+    output_dir,
+    legacy_duration=False,
+    fields=FIELDS,
+    chunk_days=CHUNK_DAYS,
+    dtype=np.float64,
+):
+    shape = np.load(di_mild_path, mmap_mode="r").shape
+    assert np.load(di_sev_path, mmap_mode="r").shape == shape
+    *batch_shape, num_strata, num_days = shape
+    os.makedirs(output_dir, exist_ok=True)
+    writer = Npy_Writer(
+        output_dir, batch_shape, num_strata, num_days, fields, chunk_days, dtype
+    )
+    simulator = Simulator(
+        moc, risk, num_days, batch_shape, legacy_duration, result=writer, dtype=dtype
+    )
+    for start in range(0, num_days, chunk_days):
+        days = slice(start, start + chunk_days)
+        simulator.run(
+            np.array(np.load(di_mild_path, mmap_mode="r")[..., days]),
+            np.array(np.load(di_sev_path, mmap_mode="r")[..., days]),
+        )
+    return writer.result()
@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from tests.helpers import random_forecast
+
+
+# the path of an .npz file of a random_forecast of 12 days, as taken by run.py
+@pytest.fixture
+def forecast(tmp_path):
+    path = str(tmp_path / "forecast.npz")
+    di_mild, di_sev, risk = random_forecast(num_days=12)
+    np.savez(path, di_mild=di_mild, di_sev=di_sev, risk=risk)
+    return path
@@ -0,0 +1,17 @@
+import numpy as np
+
+
+# the di_mild, di_sev and risk of a small forecast of three strata
+def random_forecast(seed=0, num_strata=3, num_days=8):
+    rng = np.random.default_rng(seed)
+    return (
+        rng.integers(0, 500, [num_strata, num_days]),
+        rng.integers(0, 100, [num_strata, num_days]),
+        np.array([0, 2, 0]),
+    )
+
+
+def assert_results_equal(result, expected):
+    assert list(result) == list(expected)
+    for field, values in expected.items():
+        np.testing.assert_array_equal(result[field], values, err_msg=field)
@@ -0,0 +1,41 @@
+from typing import Any, NamedTuple
+
+import numpy as np
+from hypothesis import strategies as st
+from hypothesis.extra import numpy as npst
+
+
+class Forecast_Strategies(NamedTuple):
+    # the shape [..., S, D] shared by the draws of an example
+    shape: Any
+    # incidence of that shape, for di_mild or di_sev
+    incidences: Any
+    # the risk [S] of the strata
+    risks: Any
+
+
+# strategies for the forecasts of a test, whose draws in an example share a shape of
+# min_strata to max_strata strata over 1 to max_days days, with up to 3 simulations on a
+# leading axis if batched
+def forecast_strategies(
+    min_strata=1, max_strata=3, max_days=20, max_incidence=2_000, batched=True
+):
+    batch_shapes = (
+        npst.array_shapes(min_dims=0, max_dims=1, max_side=3)
+        if batched
+        else st.just(())
+    )
+    shape = st.shared(
+        st.tuples(
+            batch_shapes,
+            st.integers(min_strata, max_strata),
+            st.integers(1, max_days),
+        ).map(lambda s: s[0] + s[1:])
+    )
+    incidences = npst.arrays(
+        dtype=np.int32, shape=shape, elements=st.integers(0, max_incidence)
+    )
+    risks = shape.flatmap(
+        lambda s: npst.arrays(dtype=np.uint8, shape=s[-2], elements=st.integers(1, 2))
+    )
+    return Forecast_Strategies(shape, incidences, risks)
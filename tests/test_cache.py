@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from patientpaths import cache, outcomes_for_moc
+from patientpaths.cache import Result_Cache, content_hash
+from patientpaths.model_of_care import model_of_care
+
+from tests.helpers import assert_results_equal, random_forecast
+
+
+def test_cache_hits_return_memory_mapped_results(tmp_path):
+    results = Result_Cache(str(tmp_path))
+    moc = model_of_care("clinics", "ACT")
+    expected = outcomes_for_moc(moc, *random_forecast(0))
+
+    assert_results_equal(results.outcomes_for_moc(moc, *random_forecast(0)), expected)
+    cached = results.outcomes_for_moc(moc, *random_forecast(0))
+    assert_results_equal(cached, expected)
+    assert isinstance(cached["deaths"], np.memmap)
+    assert (results.hits, results.misses, results.evictions) == (1, 1, 0)
+
+    # any change to the inputs is a different result
+    moc.cap_ICU += 1
+    results.outcomes_for_moc(moc, *random_forecast(0))
+    results.outcomes_for_moc(moc, *random_forecast(1))
+    results.outcomes_for_moc(moc, *random_forecast(1), legacy_duration=True)
+    selected = results.outcomes_for_moc(moc, *random_forecast(1), fields=["deaths"])
+    assert list(selected) == ["deaths"]
+    assert (results.hits, results.misses) == (1, 5)
+    assert len(os.listdir(str(tmp_path))) == 5
+
+    # single precision is a different result, whichever the backend
+    single = outcomes_for_moc(moc, *random_forecast(1), dtype=np.float32)
+    for backend in ("numpy", "jit"):
+        assert_results_equal(
+            results.outcomes_for_moc(
+                moc, *random_forecast(1), backend=backend, dtype=np.float32
+            ),
+            single,
+        )
+    assert (results.hits, results.misses) == (2, 6)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    moc = model_of_care("default", "ACT")
+    one_result = Result_Cache(str(tmp_path / "size"))
+    one_result.outcomes_for_moc(moc, *random_forecast(0))
+    size = cache.directory_size(
+        os.path.join(one_result.directory, os.listdir(one_result.directory)[0])
+    )
+
+    results = Result_Cache(str(tmp_path / "lru"), max_bytes=2 * size)
+    results.outcomes_for_moc(moc, *random_forecast(0))
+    results.outcomes_for_moc(moc, *random_forecast(1))
+    results.outcomes_for_moc(
+        moc, *random_forecast(0)
+    )  # now more recent than forecast 1
+    results.outcomes_for_moc(moc, *random_forecast(2))
+    assert results.evictions == 1
+    results.outcomes_for_moc(moc, *random_forecast(0))
+    results.outcomes_for_moc(moc, *random_forecast(2))
+    assert (results.hits, results.misses) == (3, 3)
+    results.outcomes_for_moc(moc, *random_forecast(1))
+    assert (results.hits, results.misses, results.evictions) == (3, 4, 2)
+
+
+def test_cache_keeps_a_result_cached_concurrently(tmp_path, monkeypatch):
+    results = Result_Cache(str(tmp_path))
+    moc = model_of_care("phone", "ACT")
+    results.outcomes_for_moc(moc, *random_forecast(0))
+    monkeypatch.setattr(cache.os.path, "isdir", lambda path: False)
+    assert_results_equal(
+        results.outcomes_for_moc(moc, *random_forecast(0)),
+        outcomes_for_moc(moc, *random_forecast(0)),
+    )
+    assert len(os.listdir(str(tmp_path))) == 1
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        (np.zeros(4), np.zeros(4, dtype=np.float32)),
+        (np.zeros(4), np.zeros([2, 2])),
+        ([1, 2], (1, 2)),
+        (1, 1.0),
+    ],
+)
+def test_content_hash_distinguishes_types_and_shapes(a, b):
+    assert content_hash(a) != content_hash(b)
+    assert content_hash(a) == content_hash(a)
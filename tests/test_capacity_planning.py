@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from hypothesis import given, strategies as st
+
+from patientpaths import outcomes_for_moc
+from patientpaths.capacity_planning import (
+    RESOURCES,
+    Max_Days_Over_Capacity,
+    Max_Deaths,
+    minimum_capacity,
+)
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+
+from tests.strategies import forecast_strategies
+
+_, incidences, risks = forecast_strategies(
+    max_days=25, max_incidence=300, batched=False
+)
+targets = st.builds(Max_Days_Over_Capacity, st.integers(0, 3)) | st.builds(
+    Max_Deaths, st.integers(0, 50)
+)
+# a target with a resource it may plan
+plans = targets.flatmap(
+    lambda target: st.tuples(st.sampled_from(sorted(target.resources)), st.just(target))
+)
+
+
+def meets(target, resource, result):
+    days = result["deaths"].shape[0]
+    measures = [
+        target.measure(resource, {field: result[field][d] for field in result})
+        for d in range(days)
+    ]
+    return sum(measures) <= target.limit
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    risk=risks,
+    plan=plans,
+    dtype=st.sampled_from([np.float64, np.float32]),
+)
+def test_capacity_is_least_meeting_target(moc_name, di_mild, di_sev, risk, plan, dtype):
+    """Check the capacity found meets the target, and one less does not."""
+    moc = model_of_care(moc_name, "ACT")
+    resource, target = plan
+    plan = minimum_capacity(
+        moc, di_mild, di_sev, risk, resource, target, maximum=4096, dtype=dtype
+    )
+    assert plan.days_simulated <= plan.simulations * di_mild.shape[1]
+
+    def outcomes(capacity):
+        setattr(moc, "cap_" + resource, capacity)
+        return outcomes_for_moc(moc, di_mild, di_sev, risk, dtype=dtype)
+
+    if plan.capacity is None:
+        assert not meets(target, resource, outcomes(4096))
+        return
+    assert meets(target, resource, outcomes(plan.capacity))
+    if plan.capacity > (1 if resource == "Ward" else 0):
+        assert not meets(target, resource, outcomes(plan.capacity - 1))
+
+
+def test_unreachable_target_stops_early():
+    """Check a target missed at any capacity is given up on, a day into each run."""
+    moc = model_of_care("default", "ACT")
+    di_sev = np.full([1, 10], 100, dtype=np.int32)
+    risk = np.array([2], dtype=np.uint8)
+    plan = minimum_capacity(
+        moc, np.zeros_like(di_sev), di_sev, risk, "ICU", Max_Deaths(0), maximum=8
+    )
+    # capacities 1, 2, 4 and 8 each miss on the first day, as ICU patients die
+    assert plan == (None, 4, 4)
+
+
+@pytest.mark.parametrize("resource", sorted(set(RESOURCES) - {"ICU"}))
+def test_deaths_plan_only_icu(resource):
+    """Check deaths are refused as the target of capacities they may rise with."""
+    moc = model_of_care("default", "ACT")
+    di_sev = np.full([1, 10], 100, dtype=np.int32)
+    risk = np.array([2], dtype=np.uint8)
+    with pytest.raises(AssertionError, match=resource):
+        minimum_capacity(moc, di_sev, di_sev, risk, resource, Max_Deaths(0))
@@ -0,0 +1,49 @@
+import numpy as np
+from hypothesis import given, strategies as st
+from hypothesis.extra import numpy as npst
+
+from patientpaths import compaction, outcomes_for_moc
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+from patientpaths.simulation_result import FIELDS
+
+from tests.strategies import forecast_strategies
+
+shape, _, risks = forecast_strategies(max_strata=6, max_days=15)
+# strata without incidence are common, so draw some
+presenting = shape.flatmap(lambda s: npst.arrays(bool, s[-2]))
+
+
+def incidences(elements):
+    return st.tuples(shape, presenting).flatmap(
+        lambda args: npst.arrays(np.int32, args[0], elements=elements).map(
+            lambda incidence: incidence * args[1][:, None]
+        )
+    )
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences(st.integers(0, 2_000)),
+    di_sev=incidences(st.integers(0, 400)),
+    risk=risks,
+    legacy_duration=st.booleans(),
+    fields=st.sets(st.sampled_from(FIELDS)),
+)
+def test_compacted_outcomes_are_exact(
+    moc_name, di_mild, di_sev, risk, legacy_duration, fields
+):
+    """Check simulating only the presenting strata gives the results of all of them."""
+    moc = model_of_care(moc_name, "ACT")
+    keep, *_ = compaction.compact_strata(di_mild, di_sev, risk, legacy_duration)
+    presents = np.any(di_mild + di_sev != 0, axis=-1).reshape(-1, len(risk)).any(0)
+    presents[0] |= legacy_duration
+    assert list(keep) == list(np.flatnonzero(presents))
+
+    result = compaction.outcomes_for_moc(
+        moc, di_mild, di_sev, risk, legacy_duration, fields
+    )
+    expected = outcomes_for_moc(moc, di_mild, di_sev, risk, legacy_duration, fields)
+    assert list(result) == list(expected)
+    for field, values in expected.items():
+        assert result[field].dtype == values.dtype
+        np.testing.assert_array_equal(result[field], values, err_msg=field)
@@ -0,0 +1,92 @@
+import numpy as np
+from hypothesis import given, strategies as st
+from hypothesis.extra import numpy as npst
+
+from patientpaths.components import Bed_Occupancy, allocate, allocate_duration
+
+batch = st.shared(npst.array_shapes(min_dims=0, max_dims=2, max_side=3))
+strata = st.shared(st.integers(0, 6))
+demands = st.tuples(batch, strata).flatmap(
+    lambda shape: npst.arrays(
+        dtype=np.float64,
+        shape=st.just(shape[0] + (shape[1],)),
+        elements=st.floats(0, 1_000) | st.integers(0, 1_000).map(float),
+    )
+)
+capacities = batch.flatmap(
+    lambda shape: npst.arrays(
+        dtype=np.float64,
+        shape=st.just(shape),
+        elements=st.floats(0, 5_000) | st.integers(0, 5_000).map(float),
+    )
+)
+
+
+def allocate_in_order(num_strata, demand, capacity):
+    """The allocation one cohort at a time, which allocate() must reproduce."""
+    admit = np.zeros(shape=np.shape(demand), dtype=np.int32)
+    excess = np.zeros(shape=np.shape(demand), dtype=np.int32)
+    for s in range(num_strata):
+        admit[..., s] = np.minimum(demand[..., s], capacity)
+        capacity = capacity - admit[..., s]
+        excess[..., s] = demand[..., s] - admit[..., s]
+    return admit, excess, capacity
+
+
+@given(demand=demands, capacity=capacities)
+def test_allocate_matches_in_order_allocation(demand, capacity):
+    num_strata = demand.shape[-1]
+    admit, excess, left = allocate(num_strata, demand, capacity)
+    expected_admit, expected_excess, expected_left = allocate_in_order(
+        num_strata, demand, capacity
+    )
+    np.testing.assert_array_equal(admit, expected_admit)
+    np.testing.assert_array_equal(excess, expected_excess)
+    np.testing.assert_array_equal(left, expected_left)
+
+
+@given(
+    demand=npst.arrays(np.float64, (4, 3), elements=st.floats(0, 1_000)),
+    capacity=st.integers(0, 5_000),
+)
+def test_allocate_batches_days_against_a_scalar_capacity(demand, capacity):
+    admit, excess, left = allocate(3, demand, capacity)
+    for d in range(demand.shape[0]):
+        expected = allocate_in_order(3, demand[d], capacity)
+        np.testing.assert_array_equal(admit[d], expected[0])
+        np.testing.assert_array_equal(excess[d], expected[1])
+        assert left[d] == expected[2]
+
+
+@given(
+    demand=npst.arrays(
+        np.float64,
+        st.tuples(st.integers(1, 3), st.integers(1, 4), st.integers(1, 30)),
+        elements=st.floats(0, 50),
+    ),
+    capacity=st.integers(0, 100) | st.floats(0, 100),
+    LoS=st.integers(1, 12),
+    legacy=st.booleans(),
+)
+def test_bed_occupancy_matches_allocate_duration(demand, capacity, LoS, legacy):
+    """Check the discharge calendar admits as allocate_duration over the stay."""
+    num_members, num_strata, num_days = demand.shape
+    if legacy and LoS == 1:
+        LoS = 2  # the legacy stay of LoS - 1 days must not be empty
+    beds = Bed_Occupancy(capacity, LoS, num_days, (num_members,), legacy)
+    avail = np.tile(capacity, [num_members, num_days])
+    for d in range(num_days):
+        admit, excess = beds.admit(d, demand[..., d])
+        expected = allocate_duration(
+            num_strata, num_days, avail, d, LoS, demand[..., d], legacy
+        )
+        np.testing.assert_array_equal(admit, expected[0])
+        np.testing.assert_array_equal(excess, expected[1])
+        np.testing.assert_array_equal(beds.free, avail[..., d])
+
+
+def test_bed_occupancy_discharges_over_skipped_days():
+    beds = Bed_Occupancy(3, 2, 6)
+    assert list(beds.admit(0, np.array([2.0, 2.0]))[0]) == [2, 1]
+    assert list(beds.admit(3, np.array([2.0, 2.0]))[0]) == [2, 1]
+    assert beds.free == 0
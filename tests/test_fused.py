@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from hypothesis import given, settings, strategies as st
+from hypothesis.extra import numpy as npst
+
+from patientpaths import fused, outcomes_for_moc
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+from patientpaths.simulation_result import FIELDS
+from patientpaths.simulator import presentation_demands, presentation_matrix
+
+from tests.strategies import forecast_strategies
+
+shape, incidences, risks = forecast_strategies(min_strata=0, max_strata=4)
+# beds that differ between the simulations of the leading axes
+beds = shape.flatmap(
+    lambda s: npst.arrays(dtype=np.int64, shape=s[:-2], elements=st.integers(1, 500))
+)
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    risk=risks,
+    cap_ICU=beds,
+    legacy_duration=st.booleans(),
+    fields=st.sets(st.sampled_from(FIELDS)),
+)
+@settings(deadline=None)  # for the first call of the jit backend, when compiled
+def test_fused_day_loop_is_bit_for_bit(
+    moc_name, di_mild, di_sev, risk, cap_ICU, legacy_duration, fields
+):
+    """Check the fused loop (uncompiled) gives exactly the results of the numpy path."""
+    moc = model_of_care(moc_name, "ACT")
+    moc.cap_ICU = cap_ICU
+    *batch_shape, num_strata, _ = di_mild.shape
+    pres = presentation_matrix(moc, np.zeros([*batch_shape, num_strata]))
+    pres.apply_days({"di_mild": di_mild, "di_sev": di_sev})
+    result = fused.fused_outcomes(
+        moc, risk, presentation_demands(pres), legacy_duration, fields
+    )
+    expected = outcomes_for_moc(moc, di_mild, di_sev, risk, legacy_duration, fields)
+    assert list(result) == list(expected)
+    for field, values in expected.items():
+        assert result[field].shape == values.shape
+        np.testing.assert_array_equal(result[field], values, err_msg=field)
+    # the jit backend is the same, compiled or not
+    jit = outcomes_for_moc(
+        moc, di_mild, di_sev, risk, legacy_duration, fields, backend="jit"
+    )
+    for field, values in expected.items():
+        np.testing.assert_array_equal(jit[field], values, err_msg=field)
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    risk=risks,
+    cap_ICU=beds,
+    legacy_duration=st.booleans(),
+)
+@settings(deadline=None)  # for the first call, when compiled
+def test_compiled_day_loop_is_bit_for_bit(
+    moc_name, di_mild, di_sev, risk, cap_ICU, legacy_duration
+):
+    """Check the day loop compiled with Numba gives exactly the results of the numpy path."""
+    pytest.importorskip("numba")
+    moc = model_of_care(moc_name, "ACT")
+    moc.cap_ICU = cap_ICU
+    *batch_shape, num_strata, _ = di_mild.shape
+    pres = presentation_matrix(moc, np.zeros([*batch_shape, num_strata]))
+    pres.apply_days({"di_mild": di_mild, "di_sev": di_sev})
+    result = fused.fused_outcomes(
+        moc,
+        risk,
+        presentation_demands(pres),
+        legacy_duration,
+        day_loop=fused.compiled_day_loop,
+    )
+    expected = outcomes_for_moc(moc, di_mild, di_sev, risk, legacy_duration)
+    for field, values in expected.items():
+        np.testing.assert_array_equal(result[field], values, err_msg=field)
@@ -0,0 +1,186 @@
+import numpy as np
+from hypothesis import given, strategies as st
+
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+from patientpaths.monte_carlo import (
+    Replicate_Streams,
+    outcomes_monte_carlo,
+    replicate_histograms,
+)
+from patientpaths.simulation_result import FIELDS, STRATA_FIELDS, SimulationResult
+from patientpaths.simulator import Simulator
+
+from tests.strategies import forecast_strategies
+
+_, incidences, risks = forecast_strategies(
+    max_days=15, max_incidence=500, batched=False
+)
+
+
+def replicate_results(moc, di_mild, di_sev, risk, streams, dtype=np.float64):
+    *_, num_strata, num_days = di_mild.shape
+    result = SimulationResult.zeros(
+        [streams.num_replicates], num_strata, num_days, dtype=dtype
+    )
+    Simulator(
+        moc,
+        risk,
+        num_days,
+        [streams.num_replicates],
+        result=result,
+        rng=streams,
+        dtype=dtype,
+    ).run(di_mild, di_sev)
+    return result
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    risk=risks,
+    seed=st.integers(0, 2**32),
+    block_size=st.integers(1, 3),
+    blocks=st.integers(1, 3),
+    first=st.integers(0, 2),
+    data=st.data(),
+)
+def test_replicates_split_reproduce_one_run(
+    moc_name, di_mild, di_sev, risk, seed, block_size, blocks, first, data
+):
+    """Check a range of replicates draws the same as in a run of all of them."""
+    moc = model_of_care(moc_name, "ACT")
+    # the last block may be partial, as long as it is in both runs
+    num_replicates = (first + blocks) * block_size - data.draw(
+        st.integers(0, block_size - 1)
+    )
+    start = first * block_size
+    everything = replicate_results(
+        moc,
+        di_mild,
+        di_sev,
+        risk,
+        Replicate_Streams(np.random.SeedSequence(seed), num_replicates, block_size),
+    )
+    part = replicate_results(
+        moc,
+        di_mild,
+        di_sev,
+        risk,
+        Replicate_Streams(seed, range(start, num_replicates), block_size),
+    )
+    for field in FIELDS:
+        np.testing.assert_array_equal(
+            part[field], everything[field][start:], err_msg=field
+        )
+    # every patient is whole
+    np.testing.assert_array_equal(everything["deaths"], np.round(everything["deaths"]))
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    risk=risks,
+    seed=st.integers(0, 2**32),
+    num_replicates=st.integers(1, 20),
+    quantiles=st.lists(st.floats(0, 1), min_size=1, max_size=4),
+    dtype=st.sampled_from([np.float64, np.float32]),
+)
+def test_quantiles_of_replicates(
+    moc_name, di_mild, di_sev, risk, seed, num_replicates, quantiles, dtype
+):
+    """Check the quantiles of the replicates' outputs are taken from their histograms."""
+    moc = model_of_care(moc_name, "ACT")
+    summary = outcomes_monte_carlo(
+        moc,
+        di_mild,
+        di_sev,
+        risk,
+        num_replicates,
+        seed,
+        quantiles,
+        block_size=4,
+        dtype=dtype,
+    )
+    replicates = replicate_results(
+        moc, di_mild, di_sev, risk, Replicate_Streams(seed, num_replicates, 4), dtype
+    )
+    for field in FIELDS:
+        values = replicates[field]
+        assert summary[field].shape == (len(quantiles),) + values.shape[1:]
+        for q, value in zip(quantiles, summary[field]):
+            # the smallest of the values with at least a fraction q at or below it
+            assert np.all(np.any(values == value, axis=0))
+            assert np.all(np.mean(values <= value, axis=0) >= q)
+            assert np.all(np.mean(values < value, axis=0) < max(q, 1e-9))
+    assert set(STRATA_FIELDS) <= set(summary)
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    risk=risks,
+    seed=st.integers(0, 2**32),
+    block_size=st.integers(1, 3),
+    blocks=st.integers(1, 3),
+    first=st.integers(1, 2),
+    quantiles=st.lists(st.floats(0, 1), min_size=1, max_size=4),
+    data=st.data(),
+)
+def test_histograms_of_split_replicates_merge(
+    moc_name, di_mild, di_sev, risk, seed, block_size, blocks, first, quantiles, data
+):
+    """Check merging the histograms of two workers gives the quantiles of one run."""
+    moc = model_of_care(moc_name, "ACT")
+    num_replicates = (first + blocks) * block_size - data.draw(
+        st.integers(0, block_size - 1)
+    )
+    start = first * block_size
+    parts = [
+        replicate_histograms(
+            moc,
+            di_mild,
+            di_sev,
+            risk,
+            replicates,
+            np.random.SeedSequence(seed),
+            block_size=block_size,
+        )
+        for replicates in (range(start, num_replicates), range(0, start))
+    ]
+    merged = parts[0].merge(parts[1]).quantiles(quantiles)
+    everything = outcomes_monte_carlo(
+        moc,
+        di_mild,
+        di_sev,
+        risk,
+        num_replicates,
+        seed,
+        quantiles,
+        block_size=block_size,
+    )
+    for field in FIELDS:
+        np.testing.assert_array_equal(merged[field], everything[field], err_msg=field)
+
+
+def test_snapshot_replays_the_draws():
+    """Check restoring a stochastic simulation's snapshot replays the same draws."""
+    rng = np.random.default_rng(0)
+    di_mild, di_sev = rng.integers(0, 500, (2, 3, 10))
+    streams = Replicate_Streams(0, 5, 2)
+    simulator = Simulator(
+        model_of_care("default", "ACT"), np.array([0, 1, 2]), 10, [5], rng=streams
+    )
+    for d in range(4):
+        simulator.step(di_mild[:, d], di_sev[:, d])
+    snapshot = simulator.snapshot()
+    for d in range(4, 10):
+        simulator.step(di_mild[:, d], di_sev[:, d])
+    first = {field: values.copy() for field, values in simulator.result.items()}
+    simulator.restore(snapshot)
+    for d in range(4, 10):
+        simulator.step(di_mild[:, d], di_sev[:, d])
+    for field in FIELDS:
+        np.testing.assert_array_equal(simulator.result[field], first[field])
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from hypothesis import given, strategies as st
+from hypothesis.extra import numpy as npst
+
+from patientpaths import outcomes_for_moc
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+from patientpaths.parameter_sweep import parameter_sweep
+
+FIELD_VALUES = {
+    "ward_to_ICU": st.floats(0, 1),
+    "ICU_to_death_highrisk": st.floats(0, 1),
+    "mild_to_ED": st.sampled_from([0.1, 0.2, 0.3]),
+    "sev_frac_early": st.sampled_from([0.4, 0.5]),
+    "lm_ED_cap_W0": st.floats(0.05, 1),
+    "cap_ICU": st.integers(0, 40),
+    "cap_Ward": st.integers(1, 400),
+    "cap_ED": st.integers(0, 400),
+    "LoS_ICU": st.integers(1, 15),
+    "LoS_Ward": st.integers(1, 8),
+}
+
+num_samples = st.shared(st.integers(1, 4))
+forecast_shape = st.tuples(st.integers(1, 3), st.integers(1, 25))
+
+
+@st.composite
+def sweeps(draw):
+    fields = draw(st.lists(st.sampled_from(sorted(FIELD_VALUES)), min_size=1))
+    size = draw(num_samples)
+    samples = {
+        field: draw(st.lists(FIELD_VALUES[field], min_size=size, max_size=size))
+        for field in fields
+    }
+    shape = draw(forecast_shape)
+    incidence = npst.arrays(np.int32, shape, elements=st.integers(0, 300))
+    risk = npst.arrays(np.uint8, shape[0], elements=st.integers(1, 2))
+    return samples, draw(incidence), draw(incidence), draw(risk)
+
+
+def summarise(result):
+    return {
+        # summed day by day in the deaths' dtype, as the sweep does
+        "total_deaths": np.cumsum(
+            result["deaths"].sum(axis=-1), dtype=result["deaths"].dtype
+        )[-1],
+        "peak_excess_icu": result["excess_icu"].sum(axis=-1).max(),
+        "days_icu_at_capacity": (result["avail_icu"] < 1).sum(),
+        "days_ward_at_capacity": (result["avail_ward"] < 1).sum(),
+    }
+
+
+def assert_sweep_matches_each_sample(
+    moc, samples, di_mild, di_sev, risk, legacy, dtype=np.float64
+):
+    summary = parameter_sweep(moc, samples, di_mild, di_sev, risk, legacy, dtype)
+    for p in range(len(next(iter(samples.values())))):
+        sample = SimpleNamespace(**vars(moc))
+        for field, values in samples.items():
+            setattr(sample, field, values[p])
+        expected = summarise(
+            outcomes_for_moc(sample, di_mild, di_sev, risk, legacy, dtype=dtype)
+        )
+        assert {k: v[p] for k, v in summary.items()} == expected
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    sweep=sweeps(),
+    dtype=st.sampled_from([np.float64, np.float32]),
+)
+def test_sweep_matches_each_sample(moc_name, sweep, dtype):
+    moc = model_of_care(moc_name, "ACT")
+    assert_sweep_matches_each_sample(moc, *sweep, legacy=False, dtype=dtype)
+
+
+def test_sweep_of_a_structured_table_with_legacy_stays():
+    rng = np.random.default_rng(0)
+    samples = np.zeros(6, dtype=[("ward_to_ICU", float), ("cap_ICU", int)])
+    samples["ward_to_ICU"] = rng.uniform(0, 0.5, 6)
+    samples["cap_ICU"] = rng.integers(0, 30, 6)
+    forecast = rng.integers(0, 300, [2, 3, 30])
+    assert_sweep_matches_each_sample(
+        model_of_care("cohort", "ACT"),
+        {name: samples[name] for name in samples.dtype.names},
+        *forecast,
+        np.array([0, 2, 0]),
+        legacy=True,
+    )
+    summary = parameter_sweep(
+        model_of_care("cohort", "ACT"), samples, *forecast, np.array([0, 2, 0])
+    )
+    assert summary["total_deaths"].shape == (6,)
+    with pytest.raises(AssertionError, match="not fields"):
+        parameter_sweep(model_of_care("cohort"), {"beds": [1]}, *forecast, [0, 0, 0])
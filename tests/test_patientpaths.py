@@ -1,9 +1,13 @@
+import os
+
 import numpy as np
+import pytest
 from hypothesis import given, strategies as st
 from hypothesis.extra import numpy as npst
 
 import patientpaths
 from patientpaths.model_of_care import JURISTICTIONS, MOC_NAMES, Jurisdiction
+from patientpaths.simulation_result import FIELDS, field_dtype
 
 days = st.shared(st.integers(1, 10))
 strata = st.shared(st.integers(1, 3))
@@ -12,19 +16,23 @@ daily_incidences = npst.arrays(
 )
 
 
+# TODO: remove `if` clause after adding other juristictions data
+jurisdictions = st.sampled_from(
+    [j.name for j in JURISTICTIONS if j.name == "ACT"]
+) | st.builds(
+    Jurisdiction,
+    name=st.just("<generated place>"),
+    population=st.integers(1, 20_000_000),
+    cap_ICU=st.integers(1, 1_000),
+    cap_Ward=st.integers(1, 10_000),
+    cap_ED=st.integers(1, 10_000),
+    cap_GP=st.integers(1, 10_000),
+)
+
+
 @given(
     moc_name=st.sampled_from(MOC_NAMES),
-    # TODO: remove `if` clause after adding other juristictions data
-    jurisdiction=st.sampled_from([j.name for j in JURISTICTIONS if j.name == "ACT"])
-    | st.builds(
-        Jurisdiction,
-        name=st.just("<generated place>"),
-        population=st.integers(1, 20_000_000),
-        cap_ICU=st.integers(1, 1_000),
-        cap_Ward=st.integers(1, 10_000),
-        cap_ED=st.integers(1, 10_000),
-        cap_GP=st.integers(1, 10_000),
-    ),
+    jurisdiction=jurisdictions,
     di_mild=daily_incidences,
     di_sev=daily_incidences,
     # "risk" quantised to boolean `x>1` or not, so don't waste any entropy here
@@ -35,3 +43,133 @@ def test_conservation_laws(moc_name, jurisdiction, di_mild, di_sev, risk):
     moc = patientpaths.model_of_care.model_of_care(moc_name, jurisdiction)
     patientpaths.outcomes_for_moc(moc, di_mild, di_sev, risk)
     # TODO: add assertions about results, in addition to calling the code
+
+
+members = st.shared(st.integers(1, 4))
+ensemble_incidences = st.tuples(members, strata, days).flatmap(
+    lambda shape: npst.arrays(
+        dtype=np.int32, shape=st.just(shape), elements=st.integers(0, 10_000)
+    )
+)
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=ensemble_incidences,
+    di_sev=ensemble_incidences,
+    risk=npst.arrays(dtype=np.uint8, shape=strata, elements=st.integers(1, 2)),
+    legacy_duration=st.booleans(),
+)
+def test_ensemble_matches_member_runs(moc_name, di_mild, di_sev, risk, legacy_duration):
+    """Check that a batched ensemble run equals running each member on its own."""
+    moc = patientpaths.model_of_care.model_of_care(moc_name, "ACT")
+    ensemble = patientpaths.outcomes_for_ensemble(
+        moc, di_mild, di_sev, risk, legacy_duration
+    )
+    for e in range(di_mild.shape[0]):
+        member = patientpaths.outcomes_for_moc(
+            moc, di_mild[e], di_sev[e], risk, legacy_duration
+        )
+        assert ensemble.keys() == member.keys()
+        for k, v in member.items():
+            np.testing.assert_array_equal(ensemble[k][e], v, err_msg=k)
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=daily_incidences,
+    di_sev=daily_incidences,
+    risk=npst.arrays(dtype=np.uint8, shape=strata, elements=st.integers(1, 2)),
+    fields=st.sets(st.sampled_from(FIELDS)),
+)
+def test_selected_fields_match_full_results(moc_name, di_mild, di_sev, risk, fields):
+    """Check only the selected fields are kept, with the values of a full run."""
+    moc = patientpaths.model_of_care.model_of_care(moc_name, "ACT")
+    full = patientpaths.outcomes_for_moc(moc, di_mild, di_sev, risk)
+    selected = patientpaths.outcomes_for_moc(moc, di_mild, di_sev, risk, fields=fields)
+    assert set(full) == set(FIELDS) and set(selected) == fields
+    assert len(selected) == len(fields)
+    num_strata, num_days = di_mild.shape
+    assert full["deaths"].shape == (num_days, num_strata)
+    assert full["avail_icu"].shape == (num_days,)
+    for field, values in selected.as_dict().items():
+        np.testing.assert_array_equal(values, full[field])
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    jurisdictions=st.lists(jurisdictions, min_size=1, max_size=4),
+    data=st.data(),
+)
+def test_jurisdictions_match_separate_runs(moc_name, jurisdictions, data):
+    """Check that simulating jurisdictions together equals simulating each alone."""
+    shape = st.tuples(st.just(len(jurisdictions)), strata, days)
+    di_mild = data.draw(npst.arrays(np.int32, shape, elements=st.integers(0, 10_000)))
+    di_sev = data.draw(npst.arrays(np.int32, shape, elements=st.integers(0, 10_000)))
+    # the risk of the strata, the same for every jurisdiction or each its own
+    risk_shape = st.tuples(strata) | st.tuples(st.just(len(jurisdictions)), strata)
+    risk = data.draw(npst.arrays(np.uint8, risk_shape, elements=st.integers(1, 2)))
+    together = patientpaths.outcomes_for_jurisdictions(
+        moc_name, jurisdictions, di_mild, di_sev, risk
+    )
+    for j, jurisdiction in enumerate(jurisdictions):
+        moc = patientpaths.model_of_care.model_of_care(moc_name, jurisdiction)
+        risk_of_j = risk if risk.ndim == 1 else risk[j]
+        alone = patientpaths.outcomes_for_moc(moc, di_mild[j], di_sev[j], risk_of_j)
+        for k, v in alone.items():
+            np.testing.assert_array_equal(together[k][j], v, err_msg=k)
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=ensemble_incidences,
+    di_sev=ensemble_incidences,
+    risk=npst.arrays(dtype=np.uint8, shape=strata, elements=st.integers(1, 2)),
+    legacy_duration=st.booleans(),
+)
+def test_single_precision_demands_within_a_patient(
+    moc_name, di_mild, di_sev, risk, legacy_duration
+):
+    """Check float32 keeps every output in single precision (or whole patients), and
+    each demand for a service truncates to within a patient of that of float64."""
+    moc = patientpaths.model_of_care.model_of_care(moc_name, "ACT")
+    single, double = (
+        patientpaths.outcomes_for_ensemble(
+            moc, di_mild, di_sev, risk, legacy_duration, dtype=dtype
+        )
+        for dtype in (np.float32, np.float64)
+    )
+    for field, values in single.items():
+        assert values.dtype == field_dtype(field, np.float32), field
+    for service in ("clinic_sev", "ed_sev", "clinic_mld", "ed_mld", "gp"):
+        demands = [
+            result["admit_" + service].astype(np.int64) + result["excess_" + service]
+            for result in (single, double)
+        ]
+        assert np.all(np.abs(demands[0] - demands[1]) <= 1), service
+
+
+@pytest.mark.parametrize("backend", ["numpy", "jit"])
+def test_legacy_duration_reproduces_the_original_outputs(backend):
+    """Check legacy_duration=True gives exactly the outputs of the original code.
+
+    legacy_baseline.npz holds forecasts of 4 strata over 40 days for each model of care in
+    ACT (a light one and one that fills the ICU and ward), and the outputs of the original
+    outcomes_for_moc (the first commit of this repository) for each.
+    """
+    with np.load(os.path.join(os.path.dirname(__file__), "legacy_baseline.npz")) as b:
+        baseline = dict(b)
+    cases = sorted({name.split(".")[0] for name in baseline})
+    assert len(cases) == 2 * len(MOC_NAMES)
+    for case in cases:
+        moc = patientpaths.model_of_care.model_of_care(case[:-1], "ACT")
+        di_mild, di_sev, risk = (
+            baseline[f"{case}.{name}"] for name in ("di_mild", "di_sev", "risk")
+        )
+        result = patientpaths.outcomes_for_moc(
+            moc, di_mild, di_sev, risk, legacy_duration=True, backend=backend
+        )
+        for field in FIELDS:
+            np.testing.assert_array_equal(
+                result[field], baseline[f"{case}.{field}"], err_msg=f"{case} {field}"
+            )
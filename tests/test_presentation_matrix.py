@@ -0,0 +1,62 @@
+import numpy as np
+from hypothesis import given, strategies as st
+from hypothesis.extra import numpy as npst
+
+from patientpaths.Presentation_Matrix import Presentation_Matrix
+
+LABELS = ("a", "b", "c", "d", "e")
+INPUTS = ("a", "b")
+
+days = st.shared(st.integers(1, 8))
+strata = st.shared(st.integers(1, 3))
+daily_incidences = npst.arrays(
+    dtype=np.int32, shape=st.tuples(strata, days), elements=st.integers(0, 10_000)
+)
+transitions = st.lists(
+    st.tuples(
+        st.sampled_from(LABELS),
+        st.sampled_from(LABELS),
+        st.floats(0, 1, exclude_min=True),
+    ),
+    max_size=10,
+)
+
+
+def build(transitions, default):
+    pres = Presentation_Matrix()
+    pres.set_default(default)
+    for from_label, to_label, multiplier in transitions:
+        pres.transition(from_label, to_label, multiplier)
+    return pres
+
+
+@given(
+    transitions=transitions,
+    a=daily_incidences,
+    b=daily_incidences,
+    dtype=st.sampled_from([np.float64, np.float32]),
+)
+def test_apply_days_matches_daily_apply(transitions, a, b, dtype):
+    """Check all days at once gives exactly the values of applying day by day."""
+    num_strata, num_days = a.shape
+    daily = build(transitions, np.zeros([num_strata], dtype))
+    expected = {label: [] for label in LABELS + ("unused",)}
+    for d in range(num_days):
+        daily["a"] = a[:, d]
+        daily["b"] = b[:, d]
+        daily.apply()
+        for label, values in expected.items():
+            values.append(daily[label])
+
+    at_once = build(transitions, np.zeros([num_strata], dtype))
+    series = at_once.apply_days({"a": a, "b": b})
+    labels, matrix = at_once.compile(dtype)
+    assert set(INPUTS) <= set(labels)
+    assert matrix.shape == (len(labels), len(labels))
+    assert series.shape == (len(labels), num_strata, num_days)
+    assert series.dtype == matrix.dtype == dtype
+    for label, values in expected.items():
+        assert values[-1].dtype == dtype
+        np.testing.assert_array_equal(
+            at_once[label], np.stack(values, axis=-1), err_msg=label
+        )
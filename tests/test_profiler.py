@@ -0,0 +1,42 @@
+import itertools
+
+import numpy as np
+
+from patientpaths import Simulator, outcomes_for_moc
+from patientpaths.model_of_care import model_of_care
+from patientpaths.profiler import Profiler
+
+from tests.helpers import random_forecast
+
+STEPS = ("step1", "step2", "step3", "step4", "step5", "step6", "record")
+
+
+def test_profiler_counts_each_step_of_outcomes_for_moc():
+    profiler = Profiler(clock=itertools.count().__next__)
+    di_mild, di_sev, risk = random_forecast(num_days=5)
+    moc = model_of_care("clinics", "ACT")
+    result = outcomes_for_moc(moc, di_mild, di_sev, risk, profiler=profiler)
+    np.testing.assert_array_equal(
+        result["deaths"], outcomes_for_moc(moc, di_mild, di_sev, risk)["deaths"]
+    )
+    # presentations are computed once for all days, then the other steps every day
+    assert profiler.calls == dict(dict.fromkeys(STEPS, 5), step1=1)
+    assert profiler.seconds == dict(dict.fromkeys(STEPS, 5.0), step1=1.0)
+    report = profiler.report().splitlines()
+    assert len(report) == 1 + len(STEPS)
+    assert report[1].split() == ["record", "5.0000", "16.1%", "5"]
+
+
+def test_profiler_times_a_simulator_step():
+    profiler = Profiler()
+    di_mild, di_sev, risk = random_forecast(num_days=5)
+    simulator = Simulator(model_of_care("default", "ACT"), risk, 5, profiler=profiler)
+    simulator.step(di_mild[:, 0], di_sev[:, 0])
+    assert profiler.calls == dict.fromkeys(STEPS, 1)
+    assert all(seconds >= 0 for seconds in profiler.seconds.values())
+    assert Profiler().report().split() == [
+        "step",
+        "seconds",
+        "share",
+        "calls",
+    ]
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+from patientpaths import outcomes_for_moc
+from patientpaths.model_of_care import model_of_care
+from patientpaths.run import KNOWN_JURISDICTIONS, main, sweep
+from patientpaths.simulation_result import FIELDS
+
+
+def check_results(paths, forecast, fields, dtype=np.float64):
+    with np.load(forecast) as arrays:
+        for path in paths:
+            moc_name, jurisdiction = os.path.basename(path)[:-4].split("_")
+            expected = outcomes_for_moc(
+                model_of_care(moc_name, jurisdiction),
+                arrays["di_mild"],
+                arrays["di_sev"],
+                arrays["risk"],
+                dtype=dtype,
+            )
+            with np.load(path) as result:
+                assert set(result.files) == set(fields)
+                for field in fields:
+                    np.testing.assert_array_equal(result[field], expected[field])
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+@pytest.mark.parametrize("report", [False, True])
+def test_sweep_writes_every_scenario(tmp_path, forecast, processes, report):
+    written = []
+    summary = sweep(
+        [forecast],
+        str(tmp_path / "out"),
+        moc_names=("default", "clinics"),
+        processes=processes,
+        fields=("deaths", "avail_icu"),
+        progress=written.append if report else None,
+    )
+    assert len(summary.paths) == 2 * len(KNOWN_JURISDICTIONS)
+    assert summary.throughput > 0
+    assert sorted(written) == (sorted(summary.paths) if report else [])
+    check_results(summary.paths, forecast, ("deaths", "avail_icu"))
+
+
+@pytest.mark.parametrize(
+    "options, dtype",
+    [([], np.float64), (["--backend", "jit", "--dtype", "float32"], np.float32)],
+)
+def test_main_reports_throughput(tmp_path, forecast, capsys, options, dtype):
+    main(
+        [forecast, "-o", str(tmp_path), "--moc", "phone", "--jurisdiction", "ACT"]
+        + options
+    )
+    output = capsys.readouterr().out
+    assert "1 scenarios in" in output and "scenarios/s" in output
+    path = str(tmp_path / "forecast" / "phone_ACT.npz")
+    check_results([path], forecast, FIELDS, dtype)
+    with np.load(path) as result:
+        assert result["deaths"].dtype == dtype
+
+
+def test_forecasts_of_the_same_name_are_refused(tmp_path, forecast):
+    os.makedirs(tmp_path / "other")
+    same_name = str(tmp_path / "other" / "forecast.npz")
+    with open(forecast, "rb") as original, open(same_name, "wb") as copy:
+        copy.write(original.read())
+    with pytest.raises(AssertionError, match="forecast"):
+        sweep([forecast, same_name], str(tmp_path / "out"), processes=0)
+    assert not os.path.exists(tmp_path / "out")
@@ -0,0 +1,348 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from patientpaths import outcomes_for_moc
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+from patientpaths.server import (
+    Scenario_Server,
+    decode_result,
+    load_forecasts,
+    main,
+    parse_scenario,
+)
+from patientpaths.simulation_result import FIELDS
+
+
+def expected(forecast, moc_name, capacities={}, legacy_duration=False):
+    moc = model_of_care(moc_name, "ACT")
+    for name, value in capacities.items():
+        setattr(moc, name, value)
+    di_mild, di_sev, risk = load_forecasts([forecast])["forecast"]
+    return outcomes_for_moc(moc, di_mild, di_sev, risk, legacy_duration)
+
+
+# run a coroutine in a new event loop, then cancel the tasks left (eg the handlers of closing
+# connections), as asyncio.run does, which python 3.6 lacks
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+        left = all_tasks(loop)
+        for task in left:
+            task.cancel()
+
+        async def cancelled():
+            await asyncio.gather(*left, return_exceptions=True)
+
+        loop.run_until_complete(cancelled())
+        loop.close()
+
+
+async def request(connection, method, path, body=b"", headers=""):
+    reader, writer = connection
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n{headers}\r\n".encode()
+        + body
+    )
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    line = await reader.readline()
+    while line.strip():
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+        line = await reader.readline()
+    return status, await reader.readexactly(length)
+
+
+async def post(port, scenario):
+    connection = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        return await request(
+            connection, "POST", "/scenario", json.dumps(scenario).encode()
+        )
+    finally:
+        connection[1].close()
+
+
+def serve(server, test, path=None):
+    async def serving():
+        listener = await server.start(port=0, path=path)
+        try:
+            await test(path or listener.sockets[0].getsockname()[1])
+        finally:
+            listener.close()
+            await listener.wait_closed()
+
+    run(serving())
+
+
+# the results of scenarios evaluated together (or the exceptions they raise), all arriving on
+# the same turn of the event loop, so the window cannot close between them
+def evaluate(server, scenarios):
+    async def evaluating():
+        return await asyncio.gather(
+            *(
+                server.evaluate(parse_scenario(json.dumps(s), server.forecasts))
+                for s in scenarios
+            ),
+            return_exceptions=True,
+        )
+
+    return run(evaluating())
+
+
+@pytest.mark.parametrize("legacy_duration", [False, True])
+def test_concurrent_scenarios_are_batched(forecast, legacy_duration):
+    server = Scenario_Server(load_forecasts([forecast]), window=1)
+    scenarios = [
+        dict(
+            forecast="forecast",
+            moc=moc_name,
+            jurisdiction="ACT",
+            capacities={"cap_ICU": cap_ICU, "cap_Ward": 40.5},
+            legacy_duration=legacy_duration,
+        )
+        for moc_name in MOC_NAMES
+        for cap_ICU in (0, 3, 22)
+    ]
+    for scenario, result in zip(scenarios, evaluate(server, scenarios)):
+        assert list(result) == list(FIELDS)
+        for field, values in expected(
+            forecast, scenario["moc"], scenario["capacities"], legacy_duration
+        ).items():
+            np.testing.assert_array_equal(result[field], values, err_msg=field)
+    metrics = server.metrics.as_dict()
+    assert metrics["batches"] == len(MOC_NAMES)
+    assert metrics["batch_sizes"] == {"3": len(MOC_NAMES)}
+    assert metrics["mean_batch_size"] == 3
+    assert set(metrics["simulation_ms"]) == {"p50", "p90", "p99", "max"}
+
+
+def test_full_batch_is_simulated_without_waiting(forecast):
+    server = Scenario_Server(load_forecasts([forecast]), window=60, max_batch=2)
+    scenario = dict(forecast="forecast", moc="default", jurisdiction="ACT")
+
+    async def test(port):
+        responses = await asyncio.wait_for(
+            asyncio.gather(post(port, scenario), post(port, scenario)), 10
+        )
+        assert [status for status, _ in responses] == [200, 200]
+
+    serve(server, test)
+    assert server.metrics.batch_sizes == {2: 1}
+
+
+def test_connection_is_kept_alive_and_reports_metrics(forecast):
+    server = Scenario_Server(load_forecasts([forecast]), window=0)
+    body = json.dumps(
+        dict(forecast="forecast", moc="phone", jurisdiction="ACT", fields=["deaths"])
+    ).encode()
+
+    async def test(port):
+        connection = await asyncio.open_connection("127.0.0.1", port)
+        status, content = await request(connection, "GET", "/metrics")
+        assert status == 200 and json.loads(content)["latency_ms"] == {}
+        for _ in range(2):
+            status, content = await request(connection, "POST", "/scenario", body)
+            assert status == 200 and list(decode_result(content)) == ["deaths"]
+        status, content = await request(
+            connection, "GET", "/metrics", headers="Connection: close\r\n"
+        )
+        metrics = json.loads(content)
+        assert status == 200 and metrics["batch_sizes"] == {"1": 2}
+        assert metrics["requests"] == 2 and metrics["errors"] == 0
+        assert set(metrics["latency_ms"]) == {"p50", "p90", "p99", "max"}
+        assert await connection[0].read() == b""
+        connection[1].close()
+
+    serve(server, test)
+
+
+def test_unix_socket(tmp_path, forecast):
+    server = Scenario_Server(load_forecasts([forecast]))
+    scenario = dict(forecast="forecast", moc="clinics", jurisdiction="ACT")
+
+    async def test(path):
+        connection = await asyncio.open_unix_connection(path)
+        status, content = await request(
+            connection, "POST", "/scenario", json.dumps(scenario).encode()
+        )
+        connection[1].close()
+        assert status == 200
+        np.testing.assert_array_equal(
+            decode_result(content)["deaths"], expected(forecast, "clinics")["deaths"]
+        )
+
+    serve(server, test, str(tmp_path / "server.sock"))
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"{",
+        b"[]",
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT", "x": 1}',
+        b'{"forecast": "forecast", "moc": "default"}',
+        b'{"forecast": "other", "moc": "default", "jurisdiction": "ACT"}',
+        b'{"forecast": "forecast", "moc": "other", "jurisdiction": "ACT"}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "National"}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "capacities": []}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "capacities": {"LoS_ICU": 1}}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "capacities": {"cap_ICU": true}}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "capacities": {"cap_ICU": NaN}}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "capacities": {"cap_ED": Infinity}}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "capacities": {"cap_GP": -1}}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "capacities": {"cap_Ward": 0}}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "legacy_duration": 1}',
+        b'{"forecast": "forecast", "moc": "default", "jurisdiction": "ACT",'
+        b' "fields": ["deaths", "other"]}',
+    ],
+)
+def test_invalid_scenarios_are_refused(forecast, body):
+    server = Scenario_Server(load_forecasts([forecast]))
+
+    async def test(port):
+        connection = await asyncio.open_connection("127.0.0.1", port)
+        status, content = await request(connection, "POST", "/scenario", body)
+        assert status == 400 and "error" in json.loads(content)
+        status, content = await request(connection, "GET", "/other")
+        assert status == 404 and "error" in json.loads(content)
+        connection[1].close()
+
+    serve(server, test)
+    assert server.metrics.errors == 2 and server.metrics.requests == 0
+
+
+def test_failed_simulations_answer_every_scenario(forecast):
+    server = Scenario_Server(load_forecasts([forecast]), window=60, max_batch=2)
+    scenario = dict(forecast="forecast", moc="default", jurisdiction="ACT")
+
+    def fail(scenarios):
+        raise RuntimeError("out of beds")
+
+    server.simulate = fail
+
+    async def test(port):
+        responses = await asyncio.gather(post(port, scenario), post(port, scenario))
+        assert responses == [(500, b'{"error": "out of beds"}')] * 2
+
+    serve(server, test)
+    assert server.metrics.errors == 2 and server.metrics.batches == 0
+
+
+def test_a_failed_scenario_fails_alone(forecast):
+    server = Scenario_Server(load_forecasts([forecast]), window=1)
+    simulate = server.simulate
+
+    def fail_with_13_beds(scenarios):
+        if any(("cap_ICU", 13) in scenario.capacities for scenario in scenarios):
+            raise RuntimeError("unlucky")
+        return simulate(scenarios)
+
+    server.simulate = fail_with_13_beds
+    scenarios = [
+        dict(
+            forecast="forecast",
+            moc="default",
+            jurisdiction="ACT",
+            capacities={"cap_ICU": cap_ICU},
+        )
+        for cap_ICU in (12, 13, 14)
+    ]
+    results = evaluate(server, scenarios)
+    assert isinstance(results[1], RuntimeError) and str(results[1]) == "unlucky"
+    for b in (0, 2):
+        np.testing.assert_array_equal(
+            results[b]["deaths"],
+            expected(forecast, "default", scenarios[b]["capacities"])["deaths"],
+        )
+    # the batch of three failed, and each was then simulated alone
+    assert server.metrics.batch_sizes == {1: 2}
+
+
+@pytest.mark.parametrize(
+    "sent",
+    [b"GET\r\n\r\n", b"POST /scenario HTTP/1.1\r\nContent-Length: 10\r\n\r\n{}"],
+)
+def test_malformed_requests_close_the_connection(forecast, sent):
+    server = Scenario_Server(load_forecasts([forecast]))
+
+    async def test(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(sent)
+        writer.write_eof()
+        assert await reader.read() == b""
+        writer.close()
+
+    serve(server, test)
+
+
+def test_serve_forever_announces_the_port_bound(forecast, capsys):
+    server = Scenario_Server(load_forecasts([forecast]))
+
+    async def test():
+        serving = asyncio.ensure_future(server.serve_forever(port=0))
+        output = ""
+        while "\n" not in output:
+            await asyncio.sleep(0.01)
+            output += capsys.readouterr().out
+        assert output.startswith("serving on http://127.0.0.1:")
+        port = int(output.strip().rsplit(":", 1)[1])
+        assert port != 0
+        connection = await asyncio.open_connection("127.0.0.1", port)
+        status, _ = await request(connection, "GET", "/metrics")
+        connection[1].close()
+        assert status == 200
+        serving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await serving
+
+    run(test())
+
+
+def test_serve_forever_announces_the_unix_socket(tmp_path, forecast, capsys):
+    server = Scenario_Server(load_forecasts([forecast]))
+    path = str(tmp_path / "server.sock")
+
+    async def test():
+        serving = asyncio.ensure_future(server.serve_forever(path=path))
+        while not capsys.readouterr().out == f"serving on {path}\n":
+            await asyncio.sleep(0.01)
+        serving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await serving
+
+    run(test())
+
+
+def test_main_serves_the_forecasts(forecast, monkeypatch):
+    served = []
+
+    async def serve_forever(self, host, port, path):
+        served.append((self, host, port, path))
+
+    monkeypatch.setattr(Scenario_Server, "serve_forever", serve_forever)
+    main([forecast, "--port", "0", "--window-ms", "2", "--max-batch", "8"])
+    [(server, host, port, path)] = served
+    assert (host, port, path) == ("127.0.0.1", 0, None)
+    assert (server.window, server.max_batch, server.backend) == (0.002, 8, "numpy")
+    assert set(server.forecasts) == {"forecast"}
+
+
+def test_forecasts_of_the_same_name_are_refused(tmp_path, forecast):
+    (tmp_path / "other").mkdir()
+    with pytest.raises(AssertionError, match="forecast"):
+        load_forecasts([forecast, str(tmp_path / "other" / "forecast.npz")])
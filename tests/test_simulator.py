@@ -0,0 +1,70 @@
+import numpy as np
+from hypothesis import given, strategies as st
+
+from patientpaths import outcomes_for_moc
+from patientpaths.model_of_care import MOC_NAMES, model_of_care
+from patientpaths.simulator import Simulator
+
+from tests.helpers import assert_results_equal
+from tests.strategies import forecast_strategies
+
+_, incidences, risks = forecast_strategies()
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    risk=risks,
+    legacy_duration=st.booleans(),
+    dtype=st.sampled_from([np.float64, np.float32]),
+)
+def test_stepping_matches_outcomes_for_moc(
+    moc_name, di_mild, di_sev, risk, legacy_duration, dtype
+):
+    moc = model_of_care(moc_name, "ACT")
+    *batch_shape, _, num_days = di_mild.shape
+    simulator = Simulator(
+        moc, risk, num_days, batch_shape, legacy_duration, dtype=dtype
+    )
+    for d in range(num_days):
+        simulator.step(di_mild[..., d], di_sev[..., d])
+    assert_results_equal(
+        simulator.result,
+        outcomes_for_moc(moc, di_mild, di_sev, risk, legacy_duration, dtype=dtype),
+    )
+
+
+@given(
+    moc_name=st.sampled_from(MOC_NAMES),
+    di_mild=incidences,
+    di_sev=incidences,
+    revised_mild=incidences,
+    risk=risks,
+    legacy_duration=st.booleans(),
+    data=st.data(),
+)
+def test_resuming_recomputes_a_revised_suffix(
+    moc_name, di_mild, di_sev, revised_mild, risk, legacy_duration, data
+):
+    moc = model_of_care(moc_name, "ACT")
+    *batch_shape, _, num_days = di_mild.shape
+    revised_from = data.draw(st.integers(0, num_days), label="revised_from")
+    revised_mild[..., :revised_from] = di_mild[..., :revised_from]
+
+    simulator = Simulator(moc, risk, num_days, batch_shape, legacy_duration)
+    simulator.run(di_mild[..., :revised_from], di_sev[..., :revised_from])
+    snapshot = simulator.snapshot()
+    simulator.run(di_mild[..., revised_from:], di_sev[..., revised_from:])
+    assert_results_equal(
+        simulator.result,
+        outcomes_for_moc(moc, di_mild, di_sev, risk, legacy_duration),
+    )
+
+    simulator.restore(snapshot)
+    assert simulator.day == revised_from
+    simulator.run(revised_mild[..., revised_from:], di_sev[..., revised_from:])
+    assert_results_equal(
+        simulator.result,
+        outcomes_for_moc(moc, revised_mild, di_sev, risk, legacy_duration),
+    )
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+from patientpaths import outcomes_for_moc
+from patientpaths.model_of_care import model_of_care
+from patientpaths.simulation_result import FIELDS
+from patientpaths.streaming import csv_to_npy, outcomes_for_files
+
+
+@pytest.mark.parametrize("batch_shape", [(), (3,)])
+@pytest.mark.parametrize("chunk_days", [1, 4, 64])
+@pytest.mark.parametrize("fields", [FIELDS, ("deaths", "avail_icu")])
+def test_streamed_outcomes_match_in_memory(tmp_path, batch_shape, chunk_days, fields):
+    rng = np.random.default_rng(0)
+    di_mild = rng.integers(0, 2_000, [*batch_shape, 4, 10]).astype(np.int32)
+    di_sev = rng.integers(0, 400, [*batch_shape, 4, 10]).astype(np.int32)
+    risk = np.array([1, 2, 1, 2], dtype=np.uint8)
+    np.save(str(tmp_path / "di_mild.npy"), di_mild)
+    np.save(str(tmp_path / "di_sev.npy"), di_sev)
+    moc = model_of_care("clinics", "ACT")
+
+    result = outcomes_for_files(
+        moc,
+        str(tmp_path / "di_mild.npy"),
+        str(tmp_path / "di_sev.npy"),
+        risk,
+        str(tmp_path / "outputs"),
+        fields=fields,
+        chunk_days=chunk_days,
+    )
+    expected = outcomes_for_moc(moc, di_mild, di_sev, risk, fields=fields)
+    assert list(result) == list(expected)
+    for field, values in expected.items():
+        assert isinstance(result[field], np.memmap)
+        np.testing.assert_array_equal(result[field], values, err_msg=field)
+    assert sorted(os.listdir(str(tmp_path / "outputs"))) == sorted(
+        field + ".npy" for field in fields
+    )
+
+
+def test_csv_is_converted_once(tmp_path):
+    csv_path = str(tmp_path / "di_mild.csv")
+    with open(csv_path, "w") as f:
+        f.write("1,2,3\n4.5,5,6\n")
+    npy_path = csv_to_npy(csv_path)
+    assert npy_path == str(tmp_path / "di_mild.npy")
+    np.testing.assert_array_equal(np.load(npy_path), [[1, 2, 3], [4.5, 5, 6]])
+
+    # an .npy newer than the .csv is reused, an older one converted again
+    np.save(npy_path, np.zeros([2, 3]))
+    assert csv_to_npy(csv_path) == npy_path
+    np.testing.assert_array_equal(np.load(npy_path), np.zeros([2, 3]))
+    os.utime(npy_path, (0, 0))
+    csv_to_npy(csv_path, npy_path, dtype=np.int32)
+    np.testing.assert_array_equal(np.load(npy_path), [[1, 2, 3], [4, 5, 6]])
+
+
+def test_csv_blank_lines_are_skipped(tmp_path):
+    csv_path = str(tmp_path / "di_mild.csv")
+    with open(csv_path, "w") as f:
+        f.write("1,2,3\n4,5,6\n\n")
+    np.testing.assert_array_equal(np.load(csv_to_npy(csv_path)), [[1, 2, 3], [4, 5, 6]])
+
+
+@pytest.mark.parametrize("text", ["1,2,3\n4,5\n", "1,2\n\n4,5,6\n", "\n"])
+def test_csv_rows_of_other_widths_are_refused(tmp_path, text):
+    csv_path = str(tmp_path / "di_mild.csv")
+    with open(csv_path, "w") as f:
+        f.write(text)
+    with pytest.raises(AssertionError, match="di_mild.csv"):
+        csv_to_npy(csv_path)
+    assert not os.path.exists(tmp_path / "di_mild.npy")
+
+
+def test_csv_of_a_cell_not_a_number_leaves_no_npy(tmp_path):
+    csv_path = str(tmp_path / "di_mild.csv")
+    with open(csv_path, "w") as f:
+        f.write("1,2,3\nx,5,6\n")
+    with pytest.raises(ValueError):
+        csv_to_npy(csv_path)
+    assert os.listdir(str(tmp_path)) == ["di_mild.csv"]